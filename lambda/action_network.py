@@ -1,13 +1,52 @@
 import logging
 import os
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 import requests
-from dateutil import parser
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import store
+from dates import format_event_date
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
+EVENTS_URL = 'https://actionnetwork.org/api/v2/event_campaigns/{event_campaign_id}/events'
+# concurrent page requests
+PAGE_WORKERS = 8
+RETRIES = 3
+BACKOFF = 0.5
+TIMEOUT = 30
+# converted events and sync watermark, per campaign
+SNAPSHOT = 'action_network_%s.json'
+# deleted events don't show up in a modified_date query, so re-read the
+# whole campaign this often
+FULL_SYNC_INTERVAL = timedelta(days=1)
+
+_session = None
+
+
+def get_session() -> requests.Session:
+    '''
+    keep-alive session shared by page requests (and warm Lambda invocations),
+    retrying 429/5xx with backoff
+    '''
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=PAGE_WORKERS, max_retries=retry)
+        _session = requests.Session()
+        _session.mount('https://', adapter)
+    return _session
+
 
 def make_location(event: Dict) -> str:
     location = (event.get('location', {}) or {})
@@ -54,40 +93,131 @@ def get_email_address(event: Dict) -> str:
     return get_email_address_from_organizer(get_organizer(event))
 
 
-def get_events_from_events_campaign(return_events=None,
-                                    page=1) -> Dict[str, Dict]:
-    if not return_events:
-        return_events = {}
-
+def get_page(page: int, modified_since: str = None) -> Optional[Dict]:
     log.info('\nget_events_from events_campaign (action network) -- page %d',
              page)
-
-    response = requests.get(
-        'https://actionnetwork.org/api/v2/event_campaigns/{event_campaign_id}/events?page={page}'.
-        format(
-            event_campaign_id=os.environ['ACTION_NETWORK_EVENTS_CAMPAIGN_ID'],
-            page=page),
-        headers={
-            'OSDI-API-Token': os.environ['ACTION_NETWORK_API_KEY']
-        })
+    params = {'page': page}
+    if modified_since:
+        params['filter'] = "modified_date gt '%s'" % modified_since
+    try:
+        response = get_session().get(
+            EVENTS_URL.format(
+                event_campaign_id=os.environ['ACTION_NETWORK_EVENTS_CAMPAIGN_ID']),
+            params=params,
+            headers={
+                'OSDI-API-Token': os.environ['ACTION_NETWORK_API_KEY']
+            },
+            timeout=TIMEOUT)
+    except requests.exceptions.RequestException as err:
+        metrics.incr('actionnetwork.errors')
+        log.error('ERROR\t%s getting page %d from https://actionnetwork.org/api/v2/event_campaigns',
+                  err, page)
+        return None
+    metrics.incr('actionnetwork.pages')
+    metrics.incr('actionnetwork.bytes', len(response.content))
     if response.status_code != 200:
+        metrics.incr('actionnetwork.errors')
         log.error(
             'ERROR\tResponse code %d received from https://actionnetwork.org/api/v2/event_campaigns',
             response.status_code)
-        return {}
+        return None
 
     log.info(
         '\nsuccess! get_events_from events_campaign (action network) -- page %d',
         page)
+    return response.json()
+
+
+def get_event_pages(modified_since: str = None) -> Tuple[List[Dict], List[int]]:
+    '''
+    fetch page 1, then the rest of the pages concurrently; modified_since
+    (YYYY-MM-DD) limits the pages to events modified after that date
 
-    response_json = response.json()
-    events = response_json.get('_embedded', {}).get('osdi:events', {})
-    for event in events:
-        return_events.update(convert_event(event))
+    returns the pages we got, in order, and the page numbers that failed
+    '''
+    first = get_page(1, modified_since)
+    if first is None:
+        return [], [1]
+    pages = range(2, first.get('total_pages', 1) + 1)
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+        rest = list(pool.map(lambda page: get_page(page, modified_since), pages))
+    failed = [page for page, result in zip(pages, rest) if result is None]
+    return [first] + [result for result in rest if result is not None], failed
 
-    if response_json.get('total_pages', page) > page:
-        get_events_from_events_campaign(return_events, page + 1)
 
+def get_events_from_events_campaign() -> Dict[str, Dict]:
+    '''
+    converted events from every page we could get; pages that fail after
+    retries are logged and skipped rather than dropping the whole campaign
+    '''
+    pages, failed = get_event_pages()
+    if failed:
+        log.error('ERROR\tmissing Action Network event pages %s', failed)
+    return_events = {}
+    for response_json in pages:
+        events = response_json.get('_embedded', {}).get('osdi:events', {})
+        for event in events:
+            return_events.update(convert_event(event))
+    return return_events
+
+
+def get_event_id(event: Dict) -> str:
+    identifiers = event.get('identifiers') or []
+    return identifiers[0] if identifiers else event.get('browser_url', '')
+
+
+def sync_events(now: datetime = None, dry_run: bool = False) -> Dict[str, Dict]:
+    '''
+    converted events for the campaign, fetching only events modified since the
+    last sync and applying them to a stored snapshot
+
+    cancelled events are removed from the snapshot. Every FULL_SYNC_INTERVAL
+    the whole campaign is re-read to pick up deletions. If any page fails,
+    the watermark isn't advanced, so the next run fetches those changes again.
+    Nothing is saved on a dry run
+    '''
+    now = now or datetime.now(timezone.utc)
+    name = SNAPSHOT % os.environ['ACTION_NETWORK_EVENTS_CAMPAIGN_ID']
+    snapshot = store.load_json(name, {})
+    last_full_sync = snapshot.get('full_sync')
+    full = not last_full_sync or \
+        now - datetime.fromisoformat(last_full_sync) >= FULL_SYNC_INTERVAL
+    if full:
+        log.info('full Action Network sync')
+        pages, failed = get_event_pages()
+        events = {}
+    else:
+        # modified_date filters by day; back up a day so nothing modified
+        # around the last sync is missed
+        since = datetime.fromisoformat(snapshot['watermark']) - timedelta(days=1)
+        log.info('Action Network sync since %s', since.date())
+        pages, failed = get_event_pages(since.strftime('%Y-%m-%d'))
+        events = snapshot['events']
+
+    for response_json in pages:
+        for event in response_json.get('_embedded', {}).get('osdi:events', []):
+            event_id = get_event_id(event)
+            if event.get('status') == 'cancelled':
+                events.pop(event_id, None)
+            else:
+                events[event_id] = convert_event(event)
+
+    if failed:
+        log.error('ERROR\tmissing Action Network event pages %s', failed)
+        if full:
+            # don't drop events we couldn't re-read
+            events = dict(snapshot.get('events', {}), **events)
+    elif not dry_run:
+        store.save_json(name, {
+            'watermark': now.isoformat(),
+            'full_sync': now.isoformat() if full else last_full_sync,
+            'events': events,
+        })
+
+    return_events = {}
+    for converted in events.values():
+        return_events.update(converted)
+    log.info('%d Action Network events', len(return_events))
     return return_events
 
 
@@ -105,8 +235,8 @@ def convert_event(event: Dict) -> Dict:
         'affiliate': False,
         'name': event.get('name') or event.get('title') or '',
         'event': event.get('name') or event.get('title') or '',
-        'eventDate': parser.parse(event.get(
-            'start_date', '1/20/2018')).strftime('%-m/%-d/%Y'),
+        'eventDate': format_event_date(event.get('start_date', '1/20/2018')),
+        'eventStart': event.get('start_date', ''),
         'eventLink': event.get('browser_url', ''),
         'motpLink': event.get('browser_url', ''),
         'location': make_location(event),
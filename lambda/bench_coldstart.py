@@ -0,0 +1,66 @@
+'''
+import time and first-use cost for each Lambda handler module
+
+    python bench_coldstart.py [runs]
+
+each import happens in a fresh interpreter, like a cold start; "eager" also
+imports the client libraries every handler used to load at the top level
+(boto3, googleapiclient.discovery, mapbox, PIL), for comparison. Then, in
+this process, each client is created twice to show what a warm invocation
+saves by reusing it
+'''
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HANDLERS = ('marchon', 'marchonpolls', 'family_separation', 'datasets')
+EAGER = 'import boto3, googleapiclient.discovery, mapbox, PIL.Image'
+HEAVY = ('boto3', 'googleapiclient.discovery', 'mapbox', 'PIL.Image')
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in %r if m in sys.modules))
+'''
+
+
+def import_time(statement, runs):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE % (statement, HEAVY)], check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        times.append(float(out[0]))
+    return statistics.median(times), out[1] if len(out) > 1 else '-'
+
+
+def client_times():
+    import clients
+    os.environ.setdefault('GOOGLE_API_KEY', 'bench')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    for name in ('sheets', 'drive', 's3', 'geocoder'):
+        factory = getattr(clients, name)
+        start = time.perf_counter()
+        factory()
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        factory()
+        warm = time.perf_counter() - start
+        print('%s\tfirst %.1f ms\treused %.4f ms' % (name, cold * 1000, warm * 1000))
+
+
+def main(runs=5):
+    print('median import time over %d fresh interpreters' % runs)
+    for handler in HANDLERS:
+        lazy, loaded = import_time('import %s' % handler, runs)
+        eager, _ = import_time('import %s; %s' % (handler, EAGER), runs)
+        print('%s\tlazy %.0f ms\teager %.0f ms\tloaded: %s' % (handler, lazy * 1000,
+                                                               eager * 1000, loaded))
+    client_times()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
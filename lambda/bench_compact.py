@@ -0,0 +1,85 @@
+'''
+memory to read a published dataset as parsed GeoJSON dicts and as
+compact.Features, and the time to convert
+
+    python bench_compact.py [number of features] [dataset]
+
+features are marchonpolls-like (20 string properties and a Point) by default.
+held is what tracemalloc sees still allocated once the dataset is read, so it
+counts the property values too; peak is the most allocated while reading it,
+from the response body for json.loads and from 64 KiB chunks for iter_features
+'''
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import datasets
+import fakes
+from compact import Feature, iter_features, to_geojson
+
+CHUNK_SIZE = 1 << 16
+
+
+def make_geojson(spec, n):
+    rows = fakes.make_rows(spec, n)
+    header = rows[0]
+    return json.dumps({
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'id': '%032x' % i,
+            'properties': dict(zip(header, row)),
+            'geometry': {'type': 'Point',
+                         'coordinates': [round(-125 + 58 * i / n, 5), round(25 + 24 * i / n, 5)]},
+        } for i, row in enumerate(rows[1:])]
+    }, indent=2).encode('utf8')
+
+
+def measure(read):
+    '''
+    (bytes still allocated after read(), peak bytes allocated during it, its result)
+    '''
+    gc.collect()
+    tracemalloc.start()
+    result = read()
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, peak, result
+
+
+def main(n=100000, dataset='marchonpolls'):
+    body = make_geojson(datasets.DATASETS[dataset], n)
+    print('%d %s features, %.1f MB of GeoJSON' % (n, dataset, len(body) / 1e6))
+
+    def chunks():
+        for i in range(0, len(body), CHUNK_SIZE):
+            yield body[i:i + CHUNK_SIZE]
+
+    results = [
+        ('dicts', measure(lambda: json.loads(body)['features'])),
+        ('Features', measure(lambda: [Feature(feature) for feature in iter_features(chunks())])),
+    ]
+    dict_held = results[0][1][0]
+    for name, (held, peak, _) in results:
+        print('  %-9s held %7.1f MB  %5d bytes/feature (%3.0f%%)  peak %7.1f MB' % (
+            name, held / 1e6, held / n, 100 * held / dict_held, peak / 1e6))
+
+    parsed = json.loads(body)['features']
+    start = time.perf_counter()
+    converted = [Feature(feature) for feature in parsed]
+    from_time = time.perf_counter() - start
+    start = time.perf_counter()
+    restored = [feature.to_geojson() for feature in converted]
+    to_time = time.perf_counter() - start
+    assert restored == parsed
+    assert json.dumps(converted, default=to_geojson) == json.dumps(parsed)
+    print('  Feature() %.0fms, to_geojson %.0fms; round trip equal' % (
+        from_time * 1000, to_time * 1000))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*([int(args[0])] if args else []), *args[1:2])
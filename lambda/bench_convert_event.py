@@ -0,0 +1,61 @@
+'''
+compare convert_event with the cached ISO date path to parsing every
+start_date with dateutil
+
+    python bench_convert_event.py [number of events]
+'''
+import sys
+import time
+from datetime import date, timedelta
+
+from dateutil import parser
+
+import dates
+from action_network import convert_event
+from action_network_sample_data import make_test_event
+
+
+def make_events(n):
+    events = []
+    start = date(2018, 1, 20)
+    for i in range(n):
+        event = make_test_event()
+        # a few hundred distinct dates and times, like a real campaign
+        day = start + timedelta(days=i % 365)
+        event['start_date'] = '%sT%02d:00:00Z' % (day.isoformat(), 9 + i % 10)
+        events.append(event)
+    return events
+
+
+def dateutil_event_date(event):
+    return parser.parse(event.get('start_date', '1/20/2018')).strftime('%-m/%-d/%Y')
+
+
+def main(n=100000):
+    events = make_events(n)
+
+    start = time.perf_counter()
+    baseline = [dateutil_event_date(event) for event in events]
+    dateutil_time = time.perf_counter() - start
+
+    dates.parse_date.cache_clear()
+    dates.format_event_date.cache_clear()
+    start = time.perf_counter()
+    fast = [dates.format_event_date(event['start_date']) for event in events]
+    fast_time = time.perf_counter() - start
+    assert fast == baseline
+
+    start = time.perf_counter()
+    for event in events:
+        convert_event(event)
+    convert_time = time.perf_counter() - start
+
+    print('%d events' % n)
+    print('dateutil\t%.3fs\t%.1f us/event' % (dateutil_time, dateutil_time / n * 1e6))
+    print('cached iso\t%.3fs\t%.1f us/event' % (fast_time, fast_time / n * 1e6))
+    print('speedup\t%.0fx' % (dateutil_time / fast_time))
+    print('convert_event\t%.3fs\t%.1f us/event' % (convert_time, convert_time / n * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,98 @@
+'''
+end-to-end pipeline runs against the offline fakes in fakes.py
+
+    python bench_pipeline.py [rows ...] [--dataset name ...]
+
+for each dataset and number of sheet rows (default 1000 and 10000; Action
+Network gets a tenth as many events), in a fresh process:
+
+    cold        empty bucket: every row is read, geocoded, and published
+    unchanged   the same sheet again
+    edited      a tenth of the rows renamed (and a new sheet version)
+
+and prints wall time, rows/second, the slowest stages, geocoder calls, bytes
+published, and the process's peak RSS growth so far (VmHWM; Linux only)
+'''
+import contextlib
+import io
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+
+import datasets
+import fakes
+import metrics
+import pipeline
+
+SIZES = (1000, 10000)
+STAGES = ('sheet', 'actionnetwork', 'geojson', 'geocode', 'merge', 'photos', 'upload')
+
+
+def memory_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def report(name, values, before):
+    if values.get('run.skipped'):
+        print('  %-10s skipped (sheet unchanged) in %.1fms' % (name, values['run.time']))
+        return
+    elapsed = values['run.time'] / 1000
+    rows = values.get('sheet.rows', 0) + values.get('actionnetwork.rows', 0)
+    stages = sorted(((values.get('%s.time' % stage, 0), stage) for stage in STAGES),
+                    reverse=True)
+    print('  %-10s %8.2fs %9.0f rows/s  geocode calls %-6d published %7.0f KB  '
+          'peak +%.0f MiB  [%s]' % (
+              name, elapsed, rows / elapsed,
+              values.get('geocode.api_calls', 0), values.get('publish.bytes', 0) / 1024,
+              (memory_kib('VmHWM') - before) / 1024,
+              ', '.join('%s %.0fms' % (stage, ms) for ms, stage in stages[:3] if ms)))
+
+
+def run(spec):
+    # the EMF record goes to stdout; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.run(spec)
+    return dict(metrics.current().values)
+
+
+def measure(dataset, n):
+    # action_network sets its own logger to DEBUG
+    logging.disable(logging.WARNING)
+    spec = datasets.DATASETS[dataset]
+    sheet_rows = fakes.make_rows(spec, n)
+    event_pages = fakes.make_event_pages(n // 10 if 'actionnetwork' in spec.sources else 0)
+    before = memory_kib('VmRSS')
+    print('%s: %d rows' % (dataset, n))
+    with tempfile.TemporaryDirectory() as root, \
+            fakes.offline(root, sheet_rows, event_pages) as fake:
+        report('cold', run(spec), before)
+        report('unchanged', run(spec), before)
+        name = spec.fields['name']
+        for row in sheet_rows[1::10]:
+            row[name] += ' (edited)'
+        fake['drive'].version = '2'
+        report('edited', run(spec), before)
+        published = fake['s3'].Object(pipeline.store.BUCKET, spec.output).get()
+        features = len(json.loads(published['Body'].read())['features'])
+        print('  %d features published' % features)
+
+
+def main(args):
+    names = [arg for prev, arg in zip([None] + args, args) if prev == '--dataset']
+    sizes = [int(arg) for arg in args if arg.isdigit()] or SIZES
+    for dataset in names or datasets.DATASETS:
+        for n in sizes:
+            subprocess.run([sys.executable, __file__, '--measure', dataset, str(n)],
+                           check=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,88 @@
+'''
+peak memory and time to make every photo derivative (photos.WIDTHS in each of
+photos.derivative_formats) from one large JPEG, decoding the whole original
+as we used to and with photos.make_derivatives
+
+    python bench_resize.py [width] [height]
+
+each run happens in its own process and reports how far its peak RSS
+(VmHWM) rose above its RSS before resizing; Pillow allocates image memory
+outside the Python heap, so tracemalloc doesn't see it, and ru_maxrss is
+carried over from the parent across exec. Linux only
+'''
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+import photos
+
+
+def make_jpeg(width, height):
+    # noise compresses like a photo, unlike a flat color
+    img = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+def full_decode(data):
+    '''
+    total bytes of the derivatives, each resized from the fully decoded original
+    '''
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    size = 0
+    for width in photos.WIDTHS:
+        resized = img.resize((width, int(img.size[1] * width / float(img.size[0]))),
+                             Image.LANCZOS)
+        for fmt in photos.derivative_formats():
+            out = io.BytesIO()
+            resized.save(out, format=fmt[0], **fmt[3])
+            size += out.tell()
+    return size
+
+
+def make_derivatives(data):
+    return sum(body.getbuffer().nbytes for _, _, body in photos.make_derivatives(data))
+
+
+def memory_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def measure(name, path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    before = memory_kib('VmRSS')
+    start = time.perf_counter()
+    size = globals()[name](data)
+    elapsed = time.perf_counter() - start
+    peak = memory_kib('VmHWM') - before
+    print('%s\t%.0f ms\t%.1f MiB peak\t%d bytes out' % (name, elapsed * 1000, peak / 1024,
+                                                      size))
+
+
+def main(width=4032, height=3024):
+    # made here so building the source image doesn't count toward peak RSS
+    with tempfile.NamedTemporaryFile(suffix='.jpg') as f:
+        f.write(make_jpeg(width, height))
+        f.flush()
+        print('%dx%d JPEG (%d bytes) -> %s wide in %s' % (
+            width, height, f.tell(), ', '.join(map(str, photos.WIDTHS)),
+            ', '.join(fmt[0] for fmt in photos.derivative_formats())))
+        for name in ('full_decode', 'make_derivatives'):
+            subprocess.run([sys.executable, __file__, '--measure', name, f.name], check=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+'''
+compare SpatialIndex.nearest to a haversine scan of every feature
+
+    python bench_spatial.py [number of features] [number of queries]
+'''
+import random
+import sys
+import time
+
+import spatial
+
+
+def main(n=50000, queries=200, k=5):
+    rand = random.Random(0)
+    # roughly the continental US
+    points = [(rand.uniform(-124.8, -66.9), rand.uniform(24.5, 49.4), str(i))
+              for i in range(n)]
+    targets = [(rand.uniform(24.5, 49.4), rand.uniform(-124.8, -66.9))
+               for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = spatial.SpatialIndex.build(points)
+    build = time.perf_counter() - start
+    size = len(index.dumps())
+
+    start = time.perf_counter()
+    indexed = [index.nearest(lat, lon, k) for lat, lon in targets]
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scanned = [spatial.brute_force_nearest(points, lat, lon, k) for lat, lon in targets]
+    scan_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(indexed, scanned)
+                     if [key for _, key in a] != [key for _, key in b])
+    print('%d features, %d queries, k=%d' % (n, queries, k))
+    print('build\t%.3fs\t%d bytes serialized' % (build, size))
+    print('index\t%.3f ms/query' % (indexed_time / queries * 1000))
+    print('scan\t%.3f ms/query' % (scan_time / queries * 1000))
+    print('speedup\t%.0fx\tmismatches %d' % (scan_time / indexed_time, mismatches))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
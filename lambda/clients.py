@@ -0,0 +1,82 @@
+'''
+API clients, created on first use and kept for the life of the Lambda
+container, so warm invocations reuse them
+
+the client libraries are imported on first use too; a handler that never
+geocodes doesn't load mapbox, and one that skips the run doesn't load the
+Google API client
+
+boto3 resources and googleapiclient services aren't thread-safe, so those are
+kept per thread; the Geocoder is shared. Per-thread clients only last as long
+as their thread, so code that uses them from workers should keep its pool
+for the life of the container (see photos.get_pool)
+'''
+import os
+import threading
+from typing import Callable, Dict
+
+_local = threading.local()
+_shared = {}
+_lock = threading.Lock()
+# bumped by reset, so threads other than the caller's drop their clients too
+_generation = 0
+
+
+def _per_thread(name: str, factory: Callable):
+    if _local.__dict__.get('generation') != _generation:
+        _local.clients = {}
+        _local.generation = _generation
+    clients = _local.clients
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def _google_service(name: str, version: str):
+    from googleapiclient.discovery import build
+    return build(name, version, developerKey=os.environ['GOOGLE_API_KEY'],
+                 cache_discovery=False)
+
+
+def sheets():
+    return _per_thread('sheets', lambda: _google_service('sheets', 'v4'))
+
+
+def drive():
+    return _per_thread('drive', lambda: _google_service('drive', 'v3'))
+
+
+def s3():
+    def factory():
+        import boto3
+        return boto3.resource('s3')
+
+    return _per_thread('s3', factory)
+
+
+def geocoder():
+    with _lock:
+        if 'geocoder' not in _shared:
+            from mapbox import Geocoder
+            import geocode
+            _shared['geocoder'] = geocode.set_timeout(Geocoder())
+        return _shared['geocoder']
+
+
+def reset() -> None:
+    '''
+    drop every cached client, e.g. after changing credentials in environment
+    '''
+    global _generation
+    with _lock:
+        _generation += 1
+        _shared.clear()
+
+
+def loaded() -> Dict[str, bool]:
+    '''
+    which clients this thread has created so far
+    '''
+    current = _local.__dict__.get('generation') == _generation
+    names = set(_local.__dict__.get('clients', {}) if current else {}) | set(_shared)
+    return {name: name in names for name in ('sheets', 'drive', 's3', 'geocoder')}
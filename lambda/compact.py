@@ -0,0 +1,221 @@
+'''
+a compact in-memory form of a GeoJSON feature, for holding a whole dataset
+between pipeline stages
+
+a feature dict of 20 properties is a dict for the feature, one for the
+properties, one for the geometry, and a list for the coordinates. A Feature
+is one object with __slots__: the property names are a tuple shared by every
+feature with the same names in the same order, the values a tuple, and a
+plain [lon, lat] Point is two floats. See bench_compact.py
+
+a Feature reads like the dict it came from (feature['properties'],
+feature.get('geometry'), dict(feature)), but each read builds a new dict, so
+changing one doesn't change the Feature; assign it back instead:
+
+    props = feature['properties']
+    props['photoUrl'] = url
+    feature['properties'] = props
+
+Feature.from_geojson(feature).to_geojson() == feature, with members in the
+same order; nested values other than Point coordinates (lists, dicts, other
+geometries) are shared with the original, not copied
+
+iter_features parses a FeatureCollection a feature at a time, so a published
+dataset can be read into Features without ever holding all of it as dicts
+'''
+import codecs
+import json
+import re
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, Tuple
+
+# tuples of names, shared by every Feature with those names in that order;
+# a dataset only has a handful
+_interned: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+# geometry slot for a Point kept as lon and lat
+_POINT = object()
+
+
+def intern_names(names: Tuple[str, ...]) -> Tuple[str, ...]:
+    shared = _interned.get(names)
+    if shared is None:
+        shared = _interned[names] = tuple(sys.intern(name) for name in names)
+    return shared
+
+
+def _is_point(geometry) -> bool:
+    '''
+    {"type": "Point", "coordinates": [lon, lat]} exactly, so it can be rebuilt
+    '''
+    if not isinstance(geometry, dict) or list(geometry) != ['type', 'coordinates']:
+        return False
+    coordinates = geometry['coordinates']
+    return (geometry['type'] == 'Point' and type(coordinates) is list and len(coordinates) == 2
+            and all(type(c) in (float, int) for c in coordinates))
+
+
+class Feature(Mapping):
+    __slots__ = ('members', 'type', 'id', 'names', 'props', 'lon', 'lat', 'geometry', 'extra')
+
+    def __init__(self, feature: Dict):
+        self._load(feature)
+
+    def _load(self, feature: Dict) -> None:
+        self.members = intern_names(tuple(feature))
+        self.type = feature.get('type')
+        self.id = feature.get('id')
+        properties = feature.get('properties')
+        # property names and values
+        self.names = None if properties is None else intern_names(tuple(properties))
+        self.props = () if properties is None else tuple(properties.values())
+        geometry = feature.get('geometry')
+        self.lon = self.lat = 0.0
+        if _is_point(geometry):
+            self.lon, self.lat = geometry['coordinates']
+            geometry = _POINT
+        self.geometry = geometry
+        self.extra = {
+            name: value
+            for name, value in feature.items()
+            if name not in ('type', 'id', 'properties', 'geometry')
+        } or None
+
+    @classmethod
+    def from_geojson(cls, feature: Dict) -> 'Feature':
+        return feature if isinstance(feature, cls) else cls(feature)
+
+    def __getitem__(self, name: str):
+        if name not in self.members:
+            raise KeyError(name)
+        if name == 'type':
+            return self.type
+        if name == 'id':
+            return self.id
+        if name == 'properties':
+            return None if self.names is None else dict(zip(self.names, self.props))
+        if name == 'geometry':
+            if self.geometry is _POINT:
+                return {'type': 'Point', 'coordinates': [self.lon, self.lat]}
+            return self.geometry
+        return self.extra[name]
+
+    def __setitem__(self, name: str, value) -> None:
+        feature = self.to_geojson()
+        feature[name] = value
+        self._load(feature)
+
+    def __contains__(self, name) -> bool:
+        return name in self.members
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def prop(self, name: str, default=None):
+        '''
+        one property, without building the properties dict
+        '''
+        try:
+            return self.props[self.names.index(name)]
+        except (AttributeError, ValueError):
+            return default
+
+    def to_geojson(self) -> Dict:
+        return {name: self[name] for name in self.members}
+
+
+def to_geojson(value) -> Dict:
+    '''
+    json.dumps default= for data holding Features
+    '''
+    if isinstance(value, Feature):
+        return value.to_geojson()
+    raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    '''
+    JSON values one at a time from chunks of UTF-8 text
+    '''
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf8')()
+        self.text = ''
+        self.pos = 0
+        self.done = False
+
+    def _more(self) -> bool:
+        if self.done:
+            return False
+        chunk = next(self.chunks, None)
+        self.done = chunk is None
+        # only the unparsed rest of the text is kept
+        self.text = self.text[self.pos:] + self.utf8.decode(chunk or b'', final=self.done)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        '''
+        the next character other than whitespace; '' at the end
+        '''
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._more():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError('expected %r, found %r' % (char, found))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # a number at the end of the text might go on in the next chunk
+                if end < len(self.text) or self.done:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.done:
+                    raise
+            self._more()
+
+
+def iter_features(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    '''
+    the features of a FeatureCollection, parsed one at a time from chunks of
+    its UTF-8 text; other members are skipped
+    '''
+    reader = _Reader(chunks)
+    reader.expect('{')
+    while reader.peek() == '"':
+        name = reader.value()
+        reader.expect(':')
+        if name != 'features':
+            reader.value()
+        else:
+            reader.expect('[')
+            while reader.peek() != ']':
+                yield reader.value()
+                if reader.peek() != ',':
+                    break
+                reader.pos += 1
+            reader.expect(']')
+        if reader.peek() != ',':
+            break
+        reader.pos += 1
+    reader.expect('}')
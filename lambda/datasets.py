@@ -0,0 +1,180 @@
+'''
+the maps we publish
+
+to add a map, add a DatasetSpec here and point a Lambda at
+datasets.lambda_handler with DATASET set to its name
+'''
+import os
+from typing import Dict, List
+
+import pipeline
+from pipeline import DatasetSpec
+
+
+def get_location_from_key(key: str) -> str:
+    parts = key.split('::', 1)
+    return parts[0]
+
+
+def location_queries(key: str, properties: Dict) -> List[str]:
+    # San Jose, CA doesn't return results
+    # special handling for key for actionnetwork events allows
+    # for more than one event per locaion
+    # make_key builds a compound key of <location>::<host>
+    return [get_location_from_key(key).replace(', CA', ', California')]
+
+
+def marchonpolls_queries(key: str, properties: Dict) -> List[str]:
+    location = ','.join(properties[f].strip() for f in ['city', 'state'])
+    if location.strip().lower() == 'address':
+        return []
+    # fall back to city/state when the street address doesn't geocode well
+    return [properties.get('address') + ", " + location, location]
+
+
+def family_separation_queries(key: str, properties: Dict) -> List[str]:
+    location = ' '.join(properties[f].strip() for f in ['city', 'state', 'country'])
+    location = properties.get('street_address') or location
+    if location.strip().lower() == 'address':
+        return []
+    return [location]
+
+
+AFFILIATES = DatasetSpec(
+    output='affiliates.json',
+    sheet_range='Sheet1!A1:S',
+    # 0 Group Name (as shown on website/docs), 1 Location, 2 Form filled out,
+    # 3 Main contact name, 4 Title, 5 Main contact info, 6 Secondary contact info
+    # 7 Third contact, 8 Org Status, 9 Facebook, 10 Twitter, 11 Insta,
+    # 12 Other social link, 13 Website, 14 Upcoming event, 15 Event date
+    # 16 Event Link, 17 Photo, 18 About
+    fields={
+        'name': 0,
+        'location': 1,
+        'contactName': 3,
+        'contactEmail': 5,
+        'facebook': 9,
+        'twitter': 10,
+        'instagram': 11,
+        'other': 12,
+        'website': 13,
+        'event': 14,
+        'eventDate': 15,
+        'eventLink': 16,
+        'photo': 17,
+        'about': 18
+    },
+    location_idx=1,
+    properties={'source': 'events', 'affiliate': True},
+    geocode_queries=location_queries,
+    filter_countries=True,
+    sources=('sheet', 'actionnetwork'),
+    photos=True,
+    layers=True,
+)
+
+EVENTS = DatasetSpec(
+    output='events.json',
+    sheet_range='Sheet1!A1:M',
+    # 0 January 2018 Anniversary Action Event   1 Event date  2 Event Link  3 Event location
+    # 4 Hosted by:  5 Affiliate?  6 Main contact name   7 Main contact info   8 Facebook
+    # 9 Twitter 10 Insta
+    fields={
+        'name': 0,
+        'eventDate': 1,
+        'eventLink': 2,
+        'location': 3,
+        'host': 4,
+        'affiliate': 5,
+        'contactName': 6,
+        'contactEmail': 7,
+        'facebook': 8,
+        'twitter': 9,
+        'instagram': 10,
+        'motpLink': 12
+    },
+    location_idx=3,
+    properties={'source': 'events', 'affiliate': False},
+    default_name=lambda key, props: '%s Event' % key,
+    geocode_queries=location_queries,
+    filter_countries=True,
+    sources=('sheet', 'actionnetwork'),
+    layers=True,
+    upcoming_only=True,
+    archive=True,
+)
+
+MARCHONPOLLS = DatasetSpec(
+    output='marchonpolls_events.json',
+    sheet_range='A1:Z',
+    fields={
+        'name': 1,
+        'host': 2,
+        'hostContact': 3,
+        'hostPhone': 4,
+        'eventLink': 5,
+        'facebook': 6,
+        'twitter': 7,
+        'instagram': 8,
+        'venue': 9,
+        'address': 10,
+        'city': 11,
+        'state': 12,
+        'zip': 13,
+        'eventDate': 14,
+        'startTime': 15,
+        'endTime': 16,
+        'description': 17,
+        'instructions': 18,
+        'email': 19,
+        'flagship': 20
+    },
+    ident_fields=[1, 10, 11, 12, 14],
+    default_name=lambda key, props: '%s Event' % props['city'],
+    geocode_queries=marchonpolls_queries,
+    geocode_types=['place', 'address'],
+    generated=True,
+    skip_unchanged=True,
+    tiles=True,
+    layers=True,
+    upcoming_only=True,
+    archive=True,
+)
+
+FAMILY_SEPARATION = DatasetSpec(
+    output='family_separation_events.json',
+    sheet_range='Sheet1!A1:Z',
+    fields={
+        'name': 0,
+        'eventDate': 1,
+        'eventLink': 2,
+        'city': 3,
+        'state': 4,
+        'country': 5,
+        'street_address': 13,
+    },
+    ident_fields=[2, 3, 4, 5, 13],
+    default_name=lambda key, props: '%s Event' % props['city'],
+    geocode_queries=family_separation_queries,
+    geocode_types=['place', 'address'],
+    generated=True,
+    skip_unchanged=True,
+    layers=True,
+    upcoming_only=True,
+    archive=True,
+)
+
+DATASETS = {
+    'affiliates': AFFILIATES,
+    'events': EVENTS,
+    'marchonpolls': MARCHONPOLLS,
+    'family_separation': FAMILY_SEPARATION,
+}
+
+
+def lambda_handler(event=None, context=None, dry_run=False):
+    '''
+    run the dataset named by the event's "dataset" or DATASET in environment
+    '''
+    name = (event or {}).get('dataset') or os.environ['DATASET']
+    pipeline.run(DATASETS[name], event, dry_run)
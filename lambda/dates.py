@@ -0,0 +1,105 @@
+'''
+date parsing for the pipeline
+
+Action Network dates are always ISO-8601, so datetime.fromisoformat handles
+them; dateutil is only loaded for the free-text dates people type into sheets.
+Results are memoized since the same dates come up over and over
+
+normalize parses a feature's dates once, at ingest, into properties that sort
+and compare without parsing:
+
+    eventStart   ISO-8601 start, e.g. 2019-01-19T10:00:00 (with the offset if
+                 the source gave one)
+    eventEnd     ISO-8601 end, if endTime parses
+    eventEpoch   eventStart in seconds since 1970; times without an offset are
+                 read as UTC, so it orders events but isn't an exact instant
+'''
+import calendar
+from datetime import date, datetime, time
+from functools import lru_cache
+from typing import Dict, Optional
+
+CACHE_SIZE = 4096
+
+
+# dateutil fills in whatever a value leaves out from its default, which is
+# today unless we pass one; parsing against two of these tells us whether the
+# value named a whole date, so results don't change from day to day
+_DEFAULTS = (datetime(2000, 1, 1), datetime(2001, 2, 2))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_date(value: str) -> Optional[datetime]:
+    '''
+    parse an ISO-8601 or free-text date; None if it can't be parsed or
+    doesn't give a year, month, and day (e.g. Saturday, 2pm, or January 20)
+    '''
+    value = value.strip()
+    try:
+        # fromisoformat doesn't take a Z suffix until Python 3.11
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1] + '+00:00')
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    from dateutil import parser
+    try:
+        parsed = [parser.parse(value, default=default) for default in _DEFAULTS]
+    except (ValueError, OverflowError):
+        return None
+    if parsed[0] != parsed[1]:
+        return None
+    return parsed[0]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_event_date(value: str) -> str:
+    '''
+    M/D/YYYY, as shown on the map; unparseable dates are passed through
+    '''
+    parsed = parse_date(value)
+    if not parsed:
+        return value
+    return parsed.strftime('%-m/%-d/%Y')
+
+
+def epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        return calendar.timegm(value.timetuple())
+    return int(value.timestamp())
+
+
+def day_epoch(day: date) -> int:
+    '''
+    eventEpoch of midnight at the start of day; events before it are past
+    '''
+    return epoch(datetime.combine(day, time()))
+
+
+def _with_time(day: datetime, time: str) -> Optional[datetime]:
+    '''
+    day at a free-text time like 10am or 7:30 PM; None if it doesn't parse
+    '''
+    if not time:
+        return None
+    return parse_date('%s %s' % (day.date().isoformat(), time))
+
+
+def normalize(props: Dict) -> None:
+    '''
+    set eventStart, eventEnd, and eventEpoch from eventStart (Action Network
+    start_date) or eventDate plus startTime and endTime; they're emptied if
+    there is a date field that doesn't parse, so a stale value isn't kept by
+    a merge
+    '''
+    if not (props.get('eventStart') or 'eventDate' in props):
+        return
+    start = parse_date(props['eventStart']) if props.get('eventStart') else None
+    if start is None and props.get('eventDate'):
+        start = parse_date(props['eventDate'])
+        if start is not None:
+            start = _with_time(start, props.get('startTime')) or start
+    end = _with_time(start, props.get('endTime')) if start else None
+    props['eventStart'] = start.isoformat() if start else ''
+    props['eventEnd'] = end.isoformat() if end else ''
+    props['eventEpoch'] = epoch(start) if start else None
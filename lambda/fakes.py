@@ -0,0 +1,313 @@
+'''
+local stand-ins for Sheets, Drive, Mapbox, Action Network, and S3, so a whole
+pipeline run can happen offline against synthetic data; see bench_pipeline.py
+
+    with fakes.offline(tmpdir, sheet_rows=fakes.make_rows(spec, 1000),
+                       event_pages=fakes.make_event_pages(100)):
+        pipeline.run(spec)
+
+S3 objects are files under tmpdir, so a second run sees what the first one
+published, including the geocode cache and Action Network snapshot
+'''
+import hashlib
+import io
+import json
+import os
+import re
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+from typing import Dict, List
+from urllib.parse import urlparse
+from unittest import mock
+
+import requests_mock
+from botocore.exceptions import ClientError
+
+import action_network
+import clients
+import sheets
+import store
+
+CAMPAIGN_ID = 'bench'
+EVENTS_PER_PAGE = 25
+# events fall in the year from today, so they're all upcoming
+START_DATE = date.today()
+
+ENVIRONMENT = {
+    'SHEET_ID': 'sheet',
+    'GOOGLE_API_KEY': 'offline',
+    'PHOTO_FOLDER_ID': 'photos',
+    'ACTION_NETWORK_EVENTS_CAMPAIGN_ID': CAMPAIGN_ID,
+    'ACTION_NETWORK_API_KEY': 'offline',
+    # nothing to rate limit
+    'GEOCODE_RATE': '1000000000',
+    'GEOCODE_BURST': '1000000000',
+}
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeSheets:
+    '''
+    spreadsheets().get() and spreadsheets().values().get() over a list of
+    rows; like the API, values().get() leaves off trailing empty rows
+    '''
+
+    def __init__(self, rows: List[List[str]], row_count: int = None):
+        self.rows = rows
+        # the grid's rowCount, which can run past the last row
+        self.row_count = len(rows) if row_count is None else row_count
+        # range of each values().get()
+        self.calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range=None, fields=None):
+        if range is None:
+            return FakeRequest({'sheets': [{'properties': {
+                'title': 'Sheet1',
+                'gridProperties': {'rowCount': self.row_count}
+            }}]})
+        self.calls.append(range)
+        match = sheets.RANGE_RE.match(range)
+        start, end = int(match.group('start_row')), int(match.group('end_row'))
+        values = self.rows[start - 1:end]
+        while values and not values[-1]:
+            values.pop()
+        return FakeRequest({'values': values} if values else {})
+
+
+class FakeDrive:
+    '''
+    files().get() for the sheet revision, and files().list() and
+    files().get_media() over the photos added with add()
+    '''
+
+    def __init__(self, version: str = '1', modified_time: str = '2019-01-19T00:00:00.000Z'):
+        self.version = version
+        self.modified_time = modified_time
+        self.file_list = []
+        self.data = {}
+        # fileId of each get_media() and pageToken of each list()
+        self.downloads = []
+        self.lists = []
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields):
+        return FakeRequest({'id': fileId, 'version': self.version,
+                            'modifiedTime': self.modified_time})
+
+    def list(self, q=None, pageSize=100, fields=None, pageToken=None):
+        self.lists.append(pageToken)
+        start = int(pageToken or 0)
+        response = {'files': self.file_list[start:start + pageSize]}
+        if start + pageSize < len(self.file_list):
+            response['nextPageToken'] = str(start + pageSize)
+        return FakeRequest(response)
+
+    def get_media(self, fileId):
+        self.downloads.append(fileId)
+        return FakeRequest(self.data[fileId])
+
+    def add(self, file_id: str, name: str, md5: str, size=(1200, 800),
+            modified: str = '2018-01-20T00:00:00.000Z') -> None:
+        '''
+        a solid blue JPEG photo of size in the folder
+        '''
+        from PIL import Image
+        img_bytes = io.BytesIO()
+        Image.new('RGB', size, 'blue').save(img_bytes, format='JPEG')
+        self.data[file_id] = img_bytes.getvalue()
+        self.file_list.append({'id': file_id, 'name': name, 'mimeType': 'image/jpeg',
+                               'md5Checksum': md5, 'modifiedTime': modified})
+
+
+class FakeGeocodeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, feature: Dict):
+        self.feature = feature
+
+    def geojson(self):
+        return {'type': 'FeatureCollection', 'features': [self.feature]}
+
+
+class FakeGeocoder:
+    '''
+    places every query at a point in the continental US derived from its
+    hash, with relevance 1
+    '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def forward(self, query, limit=1, country=None, types=None):
+        self.calls += 1
+        digest = hashlib.md5(query.encode('utf8')).digest()
+        lon = -125 + 58 * (digest[0] * 256 + digest[1]) / 65536.0
+        lat = 25 + 24 * (digest[2] * 256 + digest[3]) / 65536.0
+        return FakeGeocodeResponse({
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'relevance': 1,
+            'place_name': '%s, United States' % query,
+        })
+
+
+class FileObject:
+    '''
+    the parts of a boto3 S3 Object the pipeline uses, stored as a file plus a
+    .meta.json sidecar with the ETag and user metadata
+    '''
+
+    def __init__(self, root: str, key: str):
+        self.path = os.path.join(root, key)
+        self.key = key
+
+    def _meta(self):
+        try:
+            with open(self.path + '.meta.json') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+    def load(self):
+        meta = self._meta()
+        self.e_tag = meta['ETag']
+        self.metadata = meta['Metadata']
+
+    def get(self):
+        if not os.path.exists(self.path):
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        with open(self.path, 'rb') as f:
+            return {'Body': io.BytesIO(f.read())}
+
+    def put(self, Body, IfMatch=None, IfNoneMatch=None, Metadata=None, **kwargs):
+        exists = os.path.exists(self.path)
+        if (IfNoneMatch and exists) or (IfMatch and self._meta()['ETag'] != IfMatch):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        if isinstance(Body, str):
+            Body = Body.encode('utf8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(Body)
+        etag = '"%s"' % hashlib.md5(Body).hexdigest()
+        with open(self.path + '.meta.json', 'w') as f:
+            json.dump({'ETag': etag, 'Metadata': Metadata or {}}, f)
+        return {'ETag': etag}
+
+
+class FileS3:
+    def __init__(self, root: str):
+        self.root = root
+
+    def Object(self, bucket, key):
+        return FileObject(os.path.join(self.root, bucket), key)
+
+
+def _value(field: str, i: int) -> str:
+    if field in ('location', 'zip'):
+        return '%05d' % (10000 + i)
+    if field in ('city', 'state', 'country'):
+        return {'city': 'Town %d' % i, 'state': 'NY', 'country': 'US'}[field]
+    if field in ('address', 'street_address'):
+        return '%d Main St' % (i + 1)
+    if field == 'eventDate':
+        return (START_DATE + timedelta(days=i % 365)).strftime('%-m/%-d/%Y')
+    if field == 'affiliate':
+        return 'Y' if i % 2 else 'N'
+    if field == 'photo':
+        return ''
+    return '%s %d' % (field, i)
+
+
+def make_rows(spec, n: int) -> List[List[str]]:
+    '''
+    a header row and n distinct rows for the columns in spec.fields
+    '''
+    columns = dict((col, field) for field, col in spec.fields.items())
+    width = max(list(columns) + list(spec.ident_fields or [])) + 1
+    header = [columns.get(col, 'column %d' % col) for col in range(width)]
+    return [header] + [[_value(columns[col], i) if col in columns else 'x'
+                        for col in range(width)] for i in range(n)]
+
+
+def make_event(i: int) -> Dict:
+    return {
+        'identifiers': ['action_network:%d' % i],
+        'name': 'Event %d' % i,
+        'start_date': '%sT18:00:00Z' % (START_DATE + timedelta(days=i % 365)).isoformat(),
+        'browser_url': 'https://actionnetwork.org/events/event-%d' % i,
+        'status': 'confirmed',
+        'location': {'postal_code': '%05d' % (50000 + i), 'country': 'US'},
+        '_embedded': {'osdi:organizer': {
+            'given_name': 'Host',
+            'family_name': str(i),
+            'email_addresses': [{'address': 'host%d@example.com' % i, 'primary': True}],
+        }},
+    }
+
+
+def make_event_pages(n: int, per_page: int = EVENTS_PER_PAGE) -> List[Dict]:
+    events = [make_event(i) for i in range(n)]
+    total = max(1, (n + per_page - 1) // per_page)
+    return [{
+        'total_pages': total,
+        '_embedded': {'osdi:events': events[page * per_page:(page + 1) * per_page]},
+    } for page in range(total)]
+
+
+def _mock_requests(mocker, s3: FileS3, event_pages: List[Dict]) -> None:
+    def events(request, context):
+        if 'filter' in request.qs:
+            # nothing modified since the last sync
+            return {'total_pages': 1, '_embedded': {'osdi:events': []}}
+        return event_pages[int(request.qs['page'][0]) - 1]
+
+    def public_object(request, context):
+        # request.path is lowercased
+        key = urlparse(request.url).path.split('/', 2)[2]
+        try:
+            return s3.Object(store.BUCKET, key).get()['Body'].read()
+        except ClientError:
+            context.status_code = 404
+            return b''
+
+    mocker.get(action_network.EVENTS_URL.format(event_campaign_id=CAMPAIGN_ID), json=events)
+    mocker.get(re.compile(r'^https://s3\.amazonaws\.com/%s/' % store.BUCKET),
+               content=public_object)
+
+
+@contextmanager
+def offline(root: str, sheet_rows: List[List[str]], event_pages: List[Dict] = None):
+    '''
+    run the pipeline against fakes: S3 under root, the given sheet rows, and
+    Action Network pages; yields the fakes as a dict
+    '''
+    s3 = FileS3(root)
+    fake = {'s3': s3, 'sheets': FakeSheets(sheet_rows), 'drive': FakeDrive(),
+            'geocoder': FakeGeocoder()}
+    with ExitStack() as stack:
+        # restores the whole environment on exit
+        stack.enter_context(mock.patch.dict(os.environ, ENVIRONMENT))
+        os.environ.pop('STATE_DIR', None)
+        os.environ.pop('GEOCODE_BATCH', None)
+        for name, client in fake.items():
+            stack.enter_context(mock.patch.object(clients, name, lambda client=client: client))
+        mocker = stack.enter_context(requests_mock.Mocker())
+        _mock_requests(mocker, s3, event_pages or make_event_pages(0))
+        yield fake
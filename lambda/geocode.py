@@ -0,0 +1,324 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote
+
+import requests
+
+import metrics
+import store
+
+log = logging.getLogger(__name__)
+
+CACHE_NAME = 'geocode_cache.json'
+# Mapbox results for an address rarely move; misses are retried sooner in case
+# the sheet row gets fixed or Mapbox adds the place
+CACHE_TTL = 90 * 24 * 60 * 60
+NEGATIVE_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Mapbox geocoding rate limit is 600 requests/minute
+RATE = 10
+BURST = 10
+WORKERS = 8
+RETRIES = 4
+BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# seconds to connect and between bytes; a stalled request is retried
+TIMEOUT = (5, 30)
+# batch geocoding is only available on the permanent endpoint
+BATCH_DATASET = 'mapbox.places-permanent'
+BATCH_SIZE = 50
+
+
+def make_cache_key(query: str, countries: List[str] = None,
+                   types: List[str] = None) -> str:
+    # case and whitespace don't change the geocoder result
+    normalized = ' '.join(query.lower().split())
+    return '|'.join([
+        normalized,
+        ','.join(sorted(countries or [])),
+        ','.join(sorted(types or [])),
+    ])
+
+
+class GeocodeCache:
+    '''
+    geocoder results keyed by normalized query + country/types filters
+
+    entries are {'feature': {...} or None, 'expires': epoch seconds}; a None
+    feature records that the geocoder found nothing for the query
+    '''
+
+    def __init__(self, entries: Dict = None, ttl: int = CACHE_TTL,
+                 negative_ttl: int = NEGATIVE_CACHE_TTL):
+        self.entries = entries or {}
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.dirty = False
+
+    @classmethod
+    def load(cls, name: str = CACHE_NAME) -> 'GeocodeCache':
+        entries = store.load_json(name, {})
+        log.info('loaded %s cached geocodes', len(entries))
+        return cls(entries)
+
+    def save(self, name: str = CACHE_NAME) -> None:
+        if not self.dirty:
+            return
+        now = time.time()
+        self.entries = {
+            key: entry
+            for key, entry in self.entries.items() if entry['expires'] > now
+        }
+        store.save_json(name, self.entries)
+        self.dirty = False
+
+    def get(self, key: str):
+        '''
+        returns (hit, feature); feature is None for a cached miss
+        '''
+        entry = self.entries.get(key)
+        if not entry or entry['expires'] <= time.time():
+            metrics.incr('geocode.cache_misses')
+            return False, None
+        metrics.incr('geocode.cache_hits')
+        return True, entry['feature']
+
+    def has(self, key: str) -> bool:
+        '''
+        whether key has an answer (a feature or a miss) that hasn't expired
+        '''
+        entry = self.entries.get(key)
+        return bool(entry) and entry['expires'] > time.time()
+
+    def put(self, key: str, feature: Optional[Dict]) -> None:
+        ttl = self.ttl if feature else self.negative_ttl
+        self.entries[key] = {'feature': feature, 'expires': int(time.time() + ttl)}
+        self.dirty = True
+
+
+class TokenBucket:
+    '''
+    thread-safe token bucket: up to burst requests at once, refilled at rate/second
+    '''
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TimeoutAdapter(requests.adapters.HTTPAdapter):
+    '''
+    HTTPAdapter with a default timeout, since the mapbox client doesn't pass one
+    '''
+
+    def __init__(self, timeout=TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def set_timeout(service, timeout=TIMEOUT):
+    '''
+    give a mapbox service's session a default timeout; returns the service
+    '''
+    adapter = TimeoutAdapter(timeout)
+    service.session.mount('https://', adapter)
+    service.session.mount('http://', adapter)
+    return service
+
+
+def _request(send: Callable, query: str, limiter: TokenBucket = None,
+             retries: int = RETRIES, backoff: float = BACKOFF):
+    '''
+    call send(), retrying with exponential backoff on 429/5xx, connection
+    errors, and timeouts; returns the last response, or None if no request
+    got one
+    '''
+    resp = None
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = backoff * 2**(attempt - 1)
+            retry_after = resp is not None and resp.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            log.info('retrying geocode %s in %.1fs', query, delay)
+            metrics.incr('geocode.retries')
+            time.sleep(delay)
+        if limiter:
+            limiter.acquire()
+        metrics.incr('geocode.api_calls')
+        try:
+            resp = send()
+        except requests.exceptions.RequestException as err:
+            log.warning('Error geocoding %s: %s', query, err)
+            resp = None
+            continue
+        if resp.status_code not in RETRY_STATUS:
+            break
+    return resp
+
+
+def _best_feature(response: Dict) -> Optional[Dict]:
+    # only geometry, relevance, and place_name are kept from the Mapbox feature
+    features = response.get('features')
+    if not features:
+        return None
+    return {
+        'geometry': features[0]['geometry'],
+        'relevance': features[0]['relevance'],
+        'place_name': features[0].get('place_name'),
+    }
+
+
+def forward(geocoder, cache: GeocodeCache, query: str,
+            countries: List[str] = None, types: List[str] = None,
+            limiter: TokenBucket = None) -> Optional[Dict]:
+    '''
+    geocode query, returning the best feature (or None) from the cache if we can
+    '''
+    key = make_cache_key(query, countries, types)
+    hit, feature = cache.get(key)
+    if hit:
+        log.debug('geocode cache hit %s', key)
+        return feature
+    resp = _request(
+        lambda: geocoder.forward(query, limit=1, country=countries, types=types),
+        query, limiter)
+    if resp is None or resp.status_code != 200:
+        # don't cache errors
+        log.error('Error geocoding %s: HTTP %s', query,
+                  resp.status_code if resp is not None else 'connection error')
+        return None
+    feature = _best_feature(resp.geojson())
+    cache.put(key, feature)
+    return feature
+
+
+def batch_forward(geocoder, cache: GeocodeCache, queries: List[str],
+                  countries: List[str] = None, types: List[str] = None,
+                  limiter: TokenBucket = None) -> List[Optional[Dict]]:
+    '''
+    geocode up to BATCH_SIZE queries in one request to the permanent batch
+    endpoint; returns the best feature (or None) for each query, in order
+    '''
+    keys = [make_cache_key(query, countries, types) for query in queries]
+    results = [cache.get(key) for key in keys]
+    pending = [i for i, (hit, _) in enumerate(results) if not hit]
+    features = [feature for _, feature in results]
+    if not pending:
+        return features
+
+    # semicolons separate queries in a batch request
+    uri = '{base}/{dataset}/{queries}.json'.format(
+        base=geocoder.baseuri,
+        dataset=BATCH_DATASET,
+        queries=';'.join(
+            quote(queries[i].replace(';', ' '), safe='') for i in pending))
+    params = {'limit': '1'}
+    if countries:
+        params['country'] = ','.join(countries)
+    if types:
+        params['types'] = ','.join(types)
+    resp = _request(lambda: geocoder.session.get(uri, params=params),
+                    '%d queries' % len(pending), limiter)
+    if resp is None or resp.status_code != 200:
+        log.error('Error batch geocoding %s: HTTP %s',
+                  [queries[i] for i in pending],
+                  resp.status_code if resp is not None else 'connection error')
+        return features
+
+    responses = resp.json()
+    # a batch of one comes back as a single FeatureCollection
+    if isinstance(responses, dict):
+        responses = [responses]
+    for i, response in zip(pending, responses):
+        features[i] = _best_feature(response)
+        cache.put(keys[i], features[i])
+    return features
+
+
+class GeocodeExecutor:
+    '''
+    geocode many queries concurrently while staying under the Mapbox rate limit
+
+    rate, burst, and workers default to GEOCODE_RATE, GEOCODE_BURST, and
+    GEOCODE_WORKERS from environment; set GEOCODE_BATCH=1 to send queries in
+    chunks of BATCH_SIZE to the permanent batch endpoint
+    '''
+
+    def __init__(self, geocoder, cache: GeocodeCache = None, rate: float = None,
+                 burst: int = None, workers: int = None, batch: bool = None):
+        self.geocoder = geocoder
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.limiter = TokenBucket(
+            rate or float(os.environ.get('GEOCODE_RATE', RATE)),
+            burst or int(os.environ.get('GEOCODE_BURST', BURST)))
+        self.workers = workers or int(os.environ.get('GEOCODE_WORKERS', WORKERS))
+        if batch is None:
+            batch = os.environ.get('GEOCODE_BATCH', '') not in ('', '0')
+        self.batch = batch
+
+    def forward(self, query: str, countries: List[str] = None,
+                types: List[str] = None) -> Optional[Dict]:
+        return forward(self.geocoder, self.cache, query, countries, types,
+                       self.limiter)
+
+    def batch_forward(self, queries: List[str], countries: List[str] = None,
+                      types: List[str] = None) -> List[Optional[Dict]]:
+        return batch_forward(self.geocoder, self.cache, queries, countries,
+                             types, self.limiter)
+
+    def map(self, queries: Dict[str, str], countries: List[str] = None,
+            types: List[str] = None) -> Dict[str, Optional[Dict]]:
+        '''
+        geocode {key: query}, returning {key: feature or None}
+
+        identical queries are only sent once
+        '''
+        unique = {}
+        for key, query in queries.items():
+            unique.setdefault(make_cache_key(query, countries, types), query)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if self.batch:
+                values = list(unique.values())
+                chunks = [
+                    values[i:i + BATCH_SIZE]
+                    for i in range(0, len(values), BATCH_SIZE)
+                ]
+                features = [
+                    feature for chunk in pool.map(
+                        lambda c: self.batch_forward(c, countries, types), chunks)
+                    for feature in chunk
+                ]
+            else:
+                features = pool.map(lambda q: self.forward(q, countries, types),
+                                    unique.values())
+            results = dict(zip(unique, features))
+        return {
+            key: results[make_cache_key(query, countries, types)]
+            for key, query in queries.items()
+        }
@@ -0,0 +1,100 @@
+'''
+the map layers map.js splits a dataset into, by feature properties
+
+each feature belongs to at most one layer; the names are the map.js layer ids
+'''
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import dates
+from timeline import Timeline
+
+
+def is_affiliate(props: Dict) -> bool:
+    return bool(props.get('affiliate')) and props.get('affiliate') != 'No'
+
+
+#yapf:disable
+LAYERS: List[Tuple[str, Callable[[Dict], bool]]] = [
+    ('marchon-affiliate-true',
+     lambda props: props.get('source') == 'events' and is_affiliate(props)),
+    ('marchon-affiliate-false',
+     lambda props: props.get('source') == 'events' and not is_affiliate(props)),
+    ('actionnetwork',
+     lambda props: props.get('source') == 'actionnetwork'),
+    ('marchonpolls-flagship-events',
+     lambda props: 'flagship' in props and props['flagship'] == 'Yes'),
+    ('marchonpolls-events',
+     lambda props: 'flagship' in props and props['flagship'] != 'Yes'),
+    ('marchon-family-sep-events',
+     lambda props: not props.get('source') and not props.get('affiliate')),
+]
+#yapf:enable
+
+# layers whose past events map.js shows (in gray) rather than hiding
+PAST_LAYERS = {'marchon-family-sep-events': 'marchon-family-sep-events-past'}
+
+
+def layer_for(props: Dict) -> Optional[str]:
+    for name, predicate in LAYERS:
+        if predicate(props):
+            return name
+    return None
+
+
+def split(features: List[Dict]) -> Dict[str, List[Dict]]:
+    '''
+    {layer name: [features]}, in LAYERS order; features in no layer are dropped
+    '''
+    layers = {name: [] for name, _ in LAYERS}
+    for feature in features:
+        name = layer_for(feature.get('properties') or {})
+        if name:
+            layers[name].append(feature)
+    return {name: layer for name, layer in layers.items() if layer}
+
+
+def event_date(props: Dict) -> Optional[date]:
+    if props.get('eventStart'):
+        # normalized at ingest; see dates.normalize
+        return date.fromisoformat(props['eventStart'][:10])
+    value = props.get('eventDate')
+    parsed = dates.parse_date(value) if value else None
+    return parsed.date() if parsed else None
+
+
+def by_date(features: List[Dict]) -> List[Dict]:
+    '''
+    features sorted by event date then name, undated features last
+    '''
+    def key(feature):
+        when = event_date(feature['properties'])
+        return (when is None, when or date.min, feature['properties'].get('name') or '')
+
+    return sorted(features, key=key)
+
+
+def partition(features: List[Dict], today: date = None,
+              upcoming_only: bool = False) -> Dict[str, List[Dict]]:
+    '''
+    split features into layers like split, each sorted with by_date
+
+    an event is past if it starts before today, as in map.js. Past events go
+    to the layer's PAST_LAYERS layer if it has one; otherwise, if
+    upcoming_only, past and undated features are dropped
+    '''
+    start = dates.day_epoch(today or date.today())
+    partitioned = {}
+    for name, layer in split(features).items():
+        events = Timeline.from_features(dict(enumerate(layer)))
+        kept = [layer[i] for _, i in events.upcoming(start)]
+        past = [layer[i] for _, i in events.before(start)]
+        if not upcoming_only:
+            kept += [layer[i] for i in events.undated]
+        if name not in PAST_LAYERS and not upcoming_only:
+            kept += past
+        if kept:
+            partitioned[name] = by_date(kept)
+        if name in PAST_LAYERS and past:
+            partitioned[PAST_LAYERS[name]] = by_date(past)
+    return partitioned
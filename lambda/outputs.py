@@ -0,0 +1,262 @@
+'''
+smaller variants of the published GeoJSON for the map pages
+
+for events.json we publish
+    events.min.json      coordinates rounded, empty properties dropped (but
+                         see KEEP_EMPTY)
+    events.min.json.gz   same, gzip Content-Encoding
+    events.min.json.br   same, br Content-Encoding (if brotli is installed)
+    events.pbf           Geobuf (if geobuf is installed)
+
+and, for datasets with layers, one minified FeatureCollection per map layer
+(events.actionnetwork.json, ...; see layers.py) listed in events.layers.json
+
+and, for datasets with an archive, upcoming and undated events in
+events.upcoming.json and past events by month in events.2019-01.json, ...,
+listed in events.archive.json
+'''
+import gzip
+import hashlib
+import io
+import json
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+import dates
+import layers
+import store
+from compact import to_geojson
+from timeline import Timeline
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import geobuf
+except ImportError:
+    geobuf = None
+
+log = logging.getLogger(__name__)
+
+# ~1 m at the equator; plenty for a map pin
+PRECISION = 5
+# properties map.js tells apart when empty and missing: poll events are the
+# ones with a flagship property, and the climate page checks for a source
+KEEP_EMPTY = ('flagship', 'source')
+
+
+def gzip_compress(data: bytes) -> bytes:
+    '''
+    gzip with mtime 0 in the header, so the same content always compresses to
+    the same bytes (gzip.compress only takes mtime from Python 3.8)
+    '''
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def round_coordinates(coordinates, precision: int = PRECISION):
+    if isinstance(coordinates, (list, tuple)):
+        return [round_coordinates(c, precision) for c in coordinates]
+    return round(coordinates, precision)
+
+
+def minify_feature(feature: Dict, precision: int = PRECISION) -> Dict:
+    '''
+    copy of a feature with coordinates rounded to precision and empty-string
+    properties other than KEEP_EMPTY dropped
+    '''
+    feature = dict(feature)
+    feature['properties'] = {
+        key: value
+        for key, value in (feature.get('properties') or {}).items()
+        if value != '' or key in KEEP_EMPTY
+    }
+    if feature.get('geometry'):
+        feature['geometry'] = dict(
+            feature['geometry'],
+            coordinates=round_coordinates(feature['geometry']['coordinates'], precision))
+    return feature
+
+
+def minify(data: Dict, precision: int = PRECISION) -> Dict:
+    '''
+    copy of a FeatureCollection with every feature minified; see minify_feature
+    '''
+    return dict(data, features=[minify_feature(feature, precision) for feature in data['features']])
+
+
+def encode_collection(data: Dict, indent: int = None) -> bytes:
+    '''
+    json.dumps(data, indent=indent) as UTF-8 (with compact separators if
+    indent is None) for a FeatureCollection of dicts or compact.Features;
+    data['features'] can be any iterable
+
+    it's encoded a feature at a time, so only the output is ever held, not the
+    whole collection as dicts or every piece json.dumps would build for it
+    '''
+    separators = None if indent else (',', ':')
+    # features is the last member, so its [] is the last one
+    head, _, tail = json.dumps(dict(data, features=[]), indent=indent,
+                               separators=separators).rpartition('[]')
+    # each feature's lines are indented two levels, inside the object and list
+    newline = '\n' + ' ' * (2 * indent) if indent else ''
+    body = io.BytesIO()
+    body.write(head.encode('utf8'))
+    body.write(b'[')
+    count = 0
+    for feature in data['features']:
+        text = json.dumps(feature, indent=indent, separators=separators, default=to_geojson)
+        body.write(((',' if count else '') + newline + text.replace('\n', newline)).encode('utf8'))
+        count += 1
+    if count and indent:
+        body.write(('\n' + ' ' * indent).encode('utf8'))
+    body.write(b']')
+    body.write(tail.encode('utf8'))
+    return body.getvalue()
+
+
+def base_name(output: str) -> str:
+    return output[:-len('.json')] if output.endswith('.json') else output
+
+
+def make_variants(output: str, data: Dict) -> List[Tuple[str, bytes, str, str]]:
+    '''
+    [(key, body, content type, content encoding)] for each variant of output
+    '''
+    name = base_name(output)
+    body = encode_collection(dict(data, features=map(minify_feature, data['features'])))
+    variants = [
+        ('%s.min.json' % name, body, 'application/json', None),
+        ('%s.min.json.gz' % name, gzip_compress(body),
+         'application/json', 'gzip'),
+    ]
+    if brotli:
+        variants.append(('%s.min.json.br' % name, brotli.compress(body),
+                         'application/json', 'br'))
+    if geobuf:
+        minified = minify(data)
+        variants.append(('%s.pbf' % name, geobuf.encode(minified, PRECISION),
+                         'application/x-protobuf', None))
+    return variants
+
+
+def publish_variants(output: str, data: Dict, digest: str) -> None:
+    for key, body, content_type, encoding in make_variants(output, data):
+        log.info('%s: %d bytes', key, len(body))
+        extra = {'ContentEncoding': encoding} if encoding else {}
+        store.publish(key, body, content_type, digest=digest, **extra)
+
+
+def _bounds(features: List[Dict]) -> List[float]:
+    points = [f['geometry']['coordinates'] for f in features if f.get('geometry')]
+    if not points:
+        return None
+    return [min(p[0] for p in points), min(p[1] for p in points),
+            max(p[0] for p in points), max(p[1] for p in points)]
+
+
+def make_layers(output: str, data: Dict, today: date = None,
+                upcoming_only: bool = False) -> Tuple[Dict, List[Tuple[str, bytes]]]:
+    '''
+    (manifest, [(key, minified FeatureCollection)]) with a FeatureCollection
+    for each layer in layers.partition
+
+    the manifest lists each layer's key, feature count, and bounds, in
+    layers.LAYERS order
+    '''
+    today = today or date.today()
+    name = base_name(output)
+    manifest = {'date': today.isoformat(), 'layers': []}
+    bodies = []
+    for layer, features in layers.partition(data['features'], today, upcoming_only).items():
+        key = '%s.%s.json' % (name, layer)
+        minified = minify({'type': 'FeatureCollection', 'features': features})
+        bodies.append((key, json.dumps(minified, separators=(',', ':')).encode('utf8')))
+        manifest['layers'].append({
+            'id': layer,
+            'key': key,
+            'count': len(features),
+            'bounds': _bounds(minified['features']),
+        })
+    return manifest, bodies
+
+
+def _publish_gzipped(key: str, body: bytes) -> None:
+    '''
+    publish body gzip-encoded, skipped if body hasn't changed
+    '''
+    log.info('%s: %d bytes', key, len(body))
+    store.publish(key, gzip_compress(body), digest=hashlib.md5(body).hexdigest(),
+                  ContentEncoding='gzip')
+
+
+def publish_layers(output: str, data: Dict, upcoming_only: bool = False) -> None:
+    '''
+    publish make_layers gzip-encoded, skipping layers whose content hasn't
+    changed; the manifest is published last so it never lists a layer that
+    isn't there yet
+    '''
+    manifest, bodies = make_layers(output, data, upcoming_only=upcoming_only)
+    for key, body in bodies:
+        _publish_gzipped(key, body)
+    store.publish('%s.layers.json' % base_name(output),
+                  json.dumps(manifest, separators=(',', ':')))
+
+
+def make_archive(output: str, data: Dict,
+                 today: date = None) -> Tuple[Dict, List[Tuple[str, bytes]]]:
+    '''
+    (manifest, [(key, minified FeatureCollection)]) splitting data into
+    upcoming (starting today or later, or undated) and one partition per
+    month of past events, each sorted with layers.by_date; the split is a
+    timeline.Timeline lookup, so it's at midnight UTC like eventEpoch
+
+    the manifest lists the upcoming key and each month's key and feature
+    count, oldest month first
+    '''
+    today = today or date.today()
+    name = base_name(output)
+    features = data['features']
+    events = Timeline.from_features(dict(enumerate(features)))
+    start = dates.day_epoch(today)
+    upcoming = [features[i] for _, i in events.upcoming(start)]
+    upcoming += [features[i] for i in events.undated]
+    months = {}
+    for epoch, i in events.before(start):
+        month = datetime.utcfromtimestamp(epoch).strftime('%Y-%m')
+        months.setdefault(month, []).append(features[i])
+
+    def body(features):
+        minified = minify({'type': 'FeatureCollection', 'features': layers.by_date(features)})
+        return json.dumps(minified, separators=(',', ':')).encode('utf8')
+
+    upcoming_key = '%s.upcoming.json' % name
+    manifest = {
+        'date': today.isoformat(),
+        'upcoming': {'key': upcoming_key, 'count': len(upcoming)},
+        'months': [],
+    }
+    bodies = [(upcoming_key, body(upcoming))]
+    for month in sorted(months):
+        key = '%s.%s.json' % (name, month)
+        manifest['months'].append({'month': month, 'key': key, 'count': len(months[month])})
+        bodies.append((key, body(months[month])))
+    return manifest, bodies
+
+
+def publish_archive(output: str, data: Dict) -> None:
+    '''
+    publish make_archive gzip-encoded; past months rarely change, so most
+    runs only rewrite the upcoming object and the manifest, and those only
+    when their content has changed
+    '''
+    manifest, bodies = make_archive(output, data)
+    for key, body in bodies:
+        _publish_gzipped(key, body)
+    store.publish('%s.archive.json' % base_name(output),
+                  json.dumps(manifest, separators=(',', ':')))
@@ -0,0 +1,277 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import io
+import logging
+import os
+import traceback
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import clients
+import metrics
+import store
+
+log = logging.getLogger(__name__)
+
+# Drive md5Checksum -> S3 keys of the resized photo; see resize_photo
+MANIFEST = 'photos.json'
+# concurrent download/resize/upload
+WORKERS = 4
+# srcset widths; never wider than the original
+WIDTHS = (150, 300, 600)
+# Drive files.list maximum
+PAGE_SIZE = 1000
+LIST_FIELDS = 'nextPageToken,files(id,name,mimeType,md5Checksum,modifiedTime)'
+# reduce by whole factors until within this multiple of the target size,
+# then resample with LANCZOS (Pillow 7.0+)
+REDUCING_GAP = 3.0
+
+# (Pillow format, extension, content type, save options)
+AVIF = ('AVIF', 'avif', 'image/avif', {'quality': 60})
+WEBP = ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4})
+JPEG = ('JPEG', 'jpeg', 'image/jpeg', {'quality': 85, 'optimize': True})
+PNG = ('PNG', 'png', 'image/png', {'optimize': True})
+
+
+_pool = None
+
+
+def get_pool() -> ThreadPoolExecutor:
+    '''
+    worker threads kept for the life of the container, so each worker's
+    Drive service and S3 resource (clients.py keeps them per thread) are
+    reused by warm invocations instead of built again every run
+    '''
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='photos')
+    return _pool
+
+
+def iter_folder(folder_id: str, service=None, page_size: int = PAGE_SIZE) -> Iterator[Dict]:
+    '''
+    every file in a Drive folder, following nextPageToken; only the fields in
+    LIST_FIELDS are requested
+
+        {'id': 'abc', 'name': 'photo.jpg', 'mimeType': 'image/jpeg',
+         'md5Checksum': '...', 'modifiedTime': '2018-01-20T00:00:00.000Z'}
+    '''
+    service = service or clients.drive()
+    query = "'%s' in parents and trashed = false" % folder_id
+    page_token = None
+    pages = 0
+    while True:
+        response = service.files().list(q=query, pageSize=page_size, fields=LIST_FIELDS,
+                                        pageToken=page_token).execute()
+        pages += 1
+        metrics.incr('photos.list_pages')
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            log.info('listed folder %s in %d pages', folder_id, pages)
+            return
+
+
+def index_by_name(files: Iterable[Dict]) -> Dict[str, Dict]:
+    '''
+    {name: file}; if a name is used more than once, the most recently
+    modified file wins
+    '''
+    index = {}
+    for file in files:
+        current = index.get(file['name'])
+        if current:
+            log.warning('more than one photo named %s', file['name'])
+            if current.get('modifiedTime', '') >= file.get('modifiedTime', ''):
+                continue
+        index[file['name']] = file
+    return index
+
+
+def photo_url(filename: str) -> str:
+    return 'https://s3.amazonaws.com/%s/%s' % (store.BUCKET, filename)
+
+
+def _resize(img, size: Tuple[int, int]):
+    '''
+    LANCZOS resize to size, shrinking by whole factors with Image.reduce first
+    on Pillow 7.0+ (before that, resize has no reducing_gap)
+    '''
+    from PIL import Image
+    if hasattr(Image.Image, 'reduce'):
+        return img.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+    return img.resize(size, Image.LANCZOS)
+
+
+def derivative_formats(alpha: bool = False) -> List[Tuple]:
+    '''
+    formats to encode each width in, best compression first; the last one is
+    the fallback every browser can show
+
+    AVIF needs Pillow 11.2+ (or pillow-avif-plugin) and WebP needs libwebp,
+    so each is only used if this Pillow can save it
+    '''
+    from PIL import Image
+    Image.init()
+    formats = [fmt for fmt in (AVIF, WEBP) if fmt[0] in Image.SAVE]
+    formats.append(PNG if alpha else JPEG)
+    return formats
+
+
+def has_alpha(img) -> bool:
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+
+def make_derivatives(data: bytes, widths=WIDTHS) -> List[Tuple[int, Tuple, io.BytesIO]]:
+    '''
+    [(width, format, encoded)] of data at each of widths, in each of
+    derivative_formats
+
+    the original is decoded once, at the largest width, and each smaller
+    width is resized from the one before it
+    '''
+    # imported here rather than at the top: most runs have no new photos, and
+    # the datasets without photos never need it
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))
+    orig_width, orig_height = img.size
+    widths = sorted({min(width, orig_width) for width in widths}, reverse=True)
+    # JPEGs can be decoded at 1/2, 1/4, or 1/8 scale, which for a phone photo
+    # cuts decode memory by up to 64x; no-op for other formats
+    img.draft(img.mode, (widths[0], int(orig_height * widths[0] / float(orig_width))))
+    alpha = has_alpha(img)
+    img = img.convert('RGBA' if alpha else 'RGB')
+    formats = derivative_formats(alpha)
+    derivatives = []
+    for width in widths:
+        height = max(1, int(orig_height * width / float(orig_width)))
+        img = _resize(img, (width, height))
+        for fmt in formats:
+            out = io.BytesIO()
+            img.save(out, format=fmt[0], **fmt[3])
+            out.seek(0)
+            derivatives.append((width, fmt, out))
+    return derivatives
+
+
+def resize_photo(service, file) -> Dict:
+    '''
+    upload every derivative of a Drive photo; returns its manifest entry
+
+        {'fallback': key of the widest fallback image,
+         'srcset': {content type: [[key, width], ...]}}
+    '''
+    log.info('resizing %s', file['name'])
+    # named by content, so replacing a photo in Drive gets new URLs and
+    # identical photos are only stored once
+    name = file.get('md5Checksum') or file['id']
+    data = service.files().get_media(fileId=file['id']).execute()
+    derivatives = make_derivatives(data)
+    del data
+    s3 = clients.s3()
+    entry = {'fallback': None, 'srcset': {}}
+    metrics.incr('photos.resized')
+    for width, (_, ext, content_type, _), body in derivatives:
+        filename = '%s-%d.%s' % (name, width, ext)
+        metrics.incr('photos.bytes', body.getbuffer().nbytes)
+        s3.Object(store.BUCKET, filename).put(
+            Body=body,
+            ContentType=content_type,
+            ACL='public-read',
+            Expires=(datetime.now() + timedelta(hours=24 * 7)))
+        entry['srcset'].setdefault(content_type, []).append([filename, width])
+        # widest first, so the first fallback is the one to keep
+        if content_type in (JPEG[2], PNG[2]) and not entry['fallback']:
+            entry['fallback'] = filename
+    for candidates in entry['srcset'].values():
+        candidates.sort(key=lambda candidate: candidate[1])
+    log.info('%s: %d derivatives', file['name'], len(derivatives))
+    return entry
+
+
+def photo_properties(entry: Dict) -> Dict:
+    '''
+    photoUrl (the widest fallback image) and photoUrls ({content type:
+    srcset}, e.g. for <picture><source type srcset>) for a manifest entry
+    '''
+    return {
+        'photoUrl': photo_url(entry['fallback']),
+        'photoUrls': {
+            content_type: ', '.join('%s %dw' % (photo_url(filename), width)
+                                    for filename, width in candidates)
+            for content_type, candidates in entry['srcset'].items()
+        },
+    }
+
+
+def process_photo(file: Dict) -> Optional[Dict]:
+    try:
+        return resize_photo(clients.drive(), file)
+    except Exception:
+        metrics.incr('photos.errors')
+        log.error('Error resizing photo %s', file['name'])
+        traceback.print_exc()
+        return None
+
+
+def update_photos(dataset, dry_run: bool = False):
+    '''
+    resize and upload photos referenced from the dataset; returns the keys of
+    features that got a new photoUrl or photoUrls
+
+    photos already in the manifest (same Drive md5Checksum) aren't downloaded
+    again. On a dry run nothing is resized, uploaded, or saved; only photos
+    already in the manifest are filled in
+    '''
+    # map filename to affiliate keys
+    log.info('\nupdate photos')
+    photos = {}
+    for key in dataset:
+        props = dataset[key]['properties']
+        if not props.get('photo', None):
+            props['photoUrl'] = ''
+            props.pop('photoUrls', None)
+            # dataset holds compact Features, which copy on read
+            dataset[key]['properties'] = props
+            continue
+        photos.setdefault(props['photo'], []).append(key)
+    files = index_by_name(iter_folder(os.environ['PHOTO_FOLDER_ID']))
+
+    manifest = store.load_json(MANIFEST, {})
+    referenced = []
+    todo = {}
+    for name in files.keys() - photos.keys():
+        log.info('%s not referenced from dataset', name)
+    for name in photos:
+        photo = files.get(name)
+        if not photo:
+            log.warning('%s not found in photo folder', name)
+            continue
+        checksum = photo.get('md5Checksum') or photo['id']
+        referenced.append((photo, checksum))
+        # entries from before srcset support were a single filename
+        if not isinstance(manifest.get(checksum), dict):
+            todo[checksum] = photo
+    log.info('%d photos referenced, %d to resize', len(referenced), len(todo))
+
+    if todo and dry_run:
+        log.info('dry run; not resizing %d photos', len(todo))
+    elif todo:
+        for checksum, entry in zip(todo, get_pool().map(process_photo, todo.values())):
+            if entry:
+                log.info('%s saved to %s', todo[checksum]['name'],
+                         photo_url(entry['fallback']))
+                manifest[checksum] = entry
+        store.save_json(MANIFEST, manifest)
+
+    updated = []
+    for photo, checksum in referenced:
+        if not isinstance(manifest.get(checksum), dict):
+            continue
+        new_props = photo_properties(manifest[checksum])
+        for key in photos[photo['name']]:
+            props = dataset[key]['properties']
+            if any(props.get(name) != value for name, value in new_props.items()):
+                props.update(new_props)
+                dataset[key]['properties'] = props
+                updated.append(key)
+    return updated
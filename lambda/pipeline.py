@@ -0,0 +1,446 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import requests
+
+import clients
+import dates
+import geocode
+import metrics
+import outputs
+import photos
+import sheets
+import spatial
+import store
+import tiles
+from action_network import make_key, sync_events
+from compact import Feature, iter_features, to_geojson
+
+log = logging.getLogger(__name__)
+
+# geocoder results below this are too vague to map
+MIN_RELEVANCE = 0.75
+# bytes of the published GeoJSON to parse at a time
+CHUNK_SIZE = 1 << 16
+
+
+class DatasetSpec(NamedTuple):
+    '''
+    everything that differs between the maps we publish; see datasets.py
+    '''
+    # S3 key of the published GeoJSON
+    output: str
+    # e.g. Sheet1!A1:S; the first row is a header
+    sheet_range: str
+    # property name -> sheet column index
+    fields: Dict[str, int]
+    # rows are keyed by the value in this column...
+    location_idx: int = None
+    # ...or by an md5 of these columns, which is also saved as the feature id
+    ident_fields: List[int] = None
+    # base properties for every sheet row
+    properties: Dict = None
+    # (key, properties) -> name for rows without one
+    default_name: Callable = None
+    # (key, properties) -> geocoder queries to try in order; [] if the row
+    # can't be geocoded
+    geocode_queries: Callable = None
+    geocode_types: List[str] = None
+    # limit geocoding to COUNTRIES (default us,ca) from environment
+    filter_countries: bool = False
+    # names from SOURCES
+    sources: Tuple[str, ...] = ('sheet', )
+    photos: bool = False
+    # add a generated timestamp to the FeatureCollection
+    generated: bool = False
+    # skip the whole run if the sheet hasn't changed since it was last published
+    skip_unchanged: bool = False
+    # also publish a PMTiles vector tile archive; see tiles.py
+    tiles: bool = False
+    # also publish a FeatureCollection per map layer; see outputs.publish_layers
+    layers: bool = False
+    # leave past and undated events out of the layers
+    upcoming_only: bool = False
+    # also publish upcoming events and monthly partitions of past ones; see
+    # outputs.publish_archive
+    archive: bool = False
+
+
+def feature_key(spec: DatasetSpec, feature: Dict) -> str:
+    if spec.ident_fields:
+        return feature.get('id')
+    # special handling for key for actionnetwork events allows
+    # for more than one event per locaion
+    # make_key builds a compound key of <location>::<host>
+    if feature['properties'].get('source', '') == 'actionnetwork':
+        return make_key(feature['properties'])
+    return feature['properties']['location']
+
+
+def read_sheet(spec: DatasetSpec, dry_run: bool = False) -> Dict[str, Dict]:
+    log.info('\nload sheet %s', os.environ['SHEET_ID'])
+    values = sheets.iter_rows(os.environ['SHEET_ID'], spec.sheet_range)
+    # skip header row
+    next(values, None)
+    rows = {}
+    empty = {}
+    for field in spec.fields:
+        empty[field] = ''
+    # sheet row numbers, for logging
+    for idx, row in enumerate(values, 2):
+        if spec.ident_fields:
+            # minus 1 because street_address is optional and another minus 1
+            # because state is optional
+            if len(spec.ident_fields) - 2 >= len(row):
+                log.warning(
+                    'Skipping row %s - not enough columns to build identifier', idx)
+                continue
+        elif len(row) <= spec.location_idx:
+            log.info('skipping row %s; no location info', idx)
+            continue
+
+        props = dict(spec.properties or {})
+        props.update(empty)
+        for field, col in spec.fields.items():
+            if col < len(row):
+                val = row[col].strip()
+                if val:
+                    props[field] = val
+                # Y|N to boolean
+                if props[field] == 'Y':
+                    props[field] = True
+                if props[field] == 'N':
+                    props[field] = False
+
+        if spec.ident_fields:
+            ident = hashlib.md5()
+            for i in spec.ident_fields:
+                try:
+                    ident.update(row[i].encode('utf8'))
+                except IndexError:
+                    pass  # if there isn't a street_address, it's ok
+            key = ident.hexdigest()
+            feature = {'id': key, 'properties': props}
+        else:
+            key = row[spec.location_idx].strip()
+            feature = {'properties': props}
+        # skip if no location; nothing to map
+        if not key:
+            log.warning('Skipping "%s" at row %s: no location', props['name'], idx)
+            continue
+        if not props.get('name') and spec.default_name:
+            props['name'] = spec.default_name(key, props)
+        rows[key] = feature
+        log.debug('row %s\t%s\t%s', idx, props['name'], key)
+    log.info('read %s rows from sheet', len(rows))
+    return rows
+
+
+def get_action_network_events(spec: DatasetSpec, dry_run: bool = False) -> Dict[str, Dict]:
+    log.info('\nstart get Action Network events')
+    events = sync_events(dry_run=dry_run)
+    log.info('\ngot %d events from action network', len(events))
+    return events
+
+
+# name -> function(spec, dry_run) returning {key: feature}
+SOURCES = {
+    'sheet': read_sheet,
+    'actionnetwork': get_action_network_events,
+}
+
+
+def fetch_geojson(spec: DatasetSpec) -> List[Feature]:
+    '''
+    features of the published GeoJSON; [] if it hasn't been published yet
+
+    the response is parsed a feature at a time and each is kept as a compact
+    Feature, so neither the whole text nor all of it as dicts is ever held
+    '''
+    log.info('\nload geojson')
+    url = 'https://s3.amazonaws.com/%s/%s' % (store.BUCKET, spec.output)
+    with requests.get(url, stream=True) as resp:
+        if resp.status_code != 200:
+            # It hasn't been created yet
+            log.info('no existing geojson found')
+            return []
+
+        def chunks():
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                metrics.incr('geojson.bytes', len(chunk))
+                yield chunk
+
+        return [Feature(feature) for feature in iter_features(chunks())]
+
+
+def get_geojson(spec: DatasetSpec) -> Dict[str, Feature]:
+    features = {}
+    for feature in fetch_geojson(spec):
+        features[feature_key(spec, feature)] = feature
+    log.info('read %s features', len(features))
+    return features
+
+
+def get_countries(spec: DatasetSpec) -> List[str]:
+    if not spec.filter_countries:
+        return None
+    return os.environ.get('COUNTRIES', 'us,ca').split(',')
+
+
+def get_geodata(spec: DatasetSpec, sheet: Dict, keys, cache=None) -> List[str]:
+    '''
+    geocode the sheet rows for keys (in the sheet but not the GeoJSON)
+
+    returns the keys that failed for a reason that might not happen next time
+    (an HTTP or connection error; those aren't cached), as opposed to ones
+    the geocoder had no good match for
+    '''
+    executor = geocode.GeocodeExecutor(clients.geocoder(), cache)
+    countries = get_countries(spec)
+    queries = {key: spec.geocode_queries(key, sheet[key]['properties']) for key in keys}
+    results = {}
+    matched = {}
+    tried = {}
+    pending = [key for key in keys if queries[key]]
+    attempt = 0
+    while pending:
+        found = executor.map({key: queries[key][attempt]
+                              for key in pending},
+                             countries=countries,
+                             types=spec.geocode_types)
+        for key in pending:
+            results[key] = found[key]
+            matched[key] = queries[key][attempt]
+            tried[key] = attempt + 1
+        attempt += 1
+        # fall back to the next query when this one didn't geocode well
+        pending = [
+            key for key in pending if len(queries[key]) > attempt and (
+                not found[key] or found[key]['relevance'] < MIN_RELEVANCE)
+        ]
+
+    failed = [
+        key for key in keys if not results.get(key) and any(
+            not executor.cache.has(geocode.make_cache_key(query, countries, spec.geocode_types))
+            for query in queries[key][:tried.get(key, 0)])
+    ]
+    for key in keys:
+        feature = results.get(key)
+        if not feature:
+            if key in sheet:
+                del sheet[key]
+            log.warning('Error geocoding %s: %s', key, queries[key])
+            continue
+        log.debug('geocode %s\n\t%s', key, feature)
+        if feature['relevance'] < MIN_RELEVANCE:
+            log.warning('Error geocoding relevance %s: %s', key, matched[key])
+            continue
+        sheet[key]['geometry'] = feature['geometry']
+        # 'place_name': '92646, Huntington Beach, California, United States'
+        place_name = feature.get('place_name')
+        if place_name:
+            place_name = place_name.replace('%s, ' % matched[key], '').\
+                replace(', United States', '')
+            sheet[key]['properties']['placeName'] = place_name
+    return failed
+
+
+class ChangeSet(NamedTuple):
+    '''
+    keys added to, updated in, unchanged in, and removed from a dataset by merge_data
+    '''
+    added: List[str]
+    updated: List[str]
+    unchanged: List[str]
+    removed: List[str]
+
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+def content_hash(feature: Dict) -> str:
+    '''
+    stable hash of a feature's properties and geometry
+    '''
+    content = json.dumps([feature.get('properties'), feature.get('geometry')],
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(content.encode('utf8')).hexdigest()
+
+
+def merge_data(sheet: Dict, dataset: Dict) -> Tuple[Dict[str, Feature], ChangeSet]:
+    '''
+    merge sheet rows into the published dataset
+
+    returns the merged dataset as compact Features (rows without geometry and
+    features no longer in the sheet are dropped) and what changed
+    '''
+    merged = {}
+    added, updated, unchanged = [], [], []
+    for key, row in sheet.items():
+        old = dataset.get(key)
+        if old is None:
+            if not row.get('geometry'):
+                log.info('%s missing geometry; skipping', key)
+                continue
+            merged[key] = Feature(dict(row, type='Feature'))
+            added.append(key)
+            continue
+        # sheet properties win, but keep ones added later (placeName, photoUrl)
+        props = dict(old['properties'])
+        props.update(row['properties'])
+        feature = dict(old, properties=props, type='Feature')
+        if content_hash(feature) == content_hash(old):
+            unchanged.append(key)
+        else:
+            log.info('updating %s', key)
+            updated.append(key)
+        merged[key] = Feature(feature)
+    removed = [key for key in dataset if key not in merged]
+    changes = ChangeSet(added, updated, unchanged, removed)
+    log.info('%s added, %s updated, %s unchanged, %s removed: %s', len(added),
+             len(updated), len(unchanged), len(removed), removed)
+    return merged, changes
+
+
+def published_features(dataset: Dict) -> List[Dict]:
+    return [
+        feature for feature in dataset.values()
+        if not feature.get('properties', {}).get('street_address') == 'Address'
+    ]
+
+
+def features_digest(features: List[Dict]) -> str:
+    '''
+    md5 of json.dumps(features, sort_keys=True, separators=(',', ':')), for
+    dicts or Features, encoded a feature at a time
+    '''
+    digest = hashlib.md5(b'[')
+    for i, feature in enumerate(features):
+        if i:
+            digest.update(b',')
+        digest.update(json.dumps(feature, sort_keys=True, separators=(',', ':'),
+                                 default=to_geojson).encode('utf8'))
+    digest.update(b']')
+    return digest.hexdigest()
+
+
+def upload(spec: DatasetSpec, dataset: Dict, dry_run: bool) -> None:
+    data = {'type': 'FeatureCollection'}
+    if spec.generated:
+        data['generated'] = datetime.now().isoformat()
+    data['features'] = published_features(dataset)
+    if dry_run:
+        print(json.dumps(data, default=to_geojson))
+        return
+    # generated changes every run, so leave it out of the digest
+    digest = features_digest(data['features'])
+    outputs.publish_variants(spec.output, data, digest)
+    index = spatial.SpatialIndex.from_features(
+        {feature_key(spec, feature): feature
+         for feature in data['features']})
+    store.publish('%s.index.json' % outputs.base_name(spec.output), index.dumps(),
+                  digest=digest)
+    if spec.tiles:
+        with metrics.stage('tiles'):
+            archive = tiles.make_archive(outputs.base_name(spec.output), data)
+        metrics.incr('tiles.bytes', len(archive))
+        store.publish('%s.pmtiles' % outputs.base_name(spec.output), archive,
+                      'application/vnd.pmtiles', digest=digest)
+    # last, since the next run merges into it: if anything above fails, the
+    # next run still sees these changes and publishes everything again
+    store.publish(spec.output, outputs.encode_collection(data, indent=2), digest=digest)
+
+
+def publish_views(spec: DatasetSpec, features: List[Dict]) -> None:
+    '''
+    publish the layers and archive of the published features
+
+    called every run, even when the sheet or dataset hasn't changed, so
+    events move out of the upcoming layers and object once they're past;
+    layers and months that haven't changed aren't re-uploaded
+    '''
+    if spec.layers:
+        with metrics.stage('layers'):
+            outputs.publish_layers(spec.output, {'features': features}, spec.upcoming_only)
+    if spec.archive:
+        with metrics.stage('archive'):
+            outputs.publish_archive(spec.output, {'features': features})
+
+
+def run(spec: DatasetSpec, event=None, dry_run=False) -> None:
+    '''
+    read, geocode, merge, and publish one dataset; each stage is timed and the
+    run's metrics are printed as one EMF record (see metrics.py) even if it fails
+    '''
+    metrics.reset()
+    try:
+        with metrics.stage('run'):
+            _run(spec, event, dry_run)
+    finally:
+        metrics.emit({'Dataset': spec.output})
+
+
+def _run(spec: DatasetSpec, event, dry_run: bool) -> None:
+    revision = None
+    if spec.skip_unchanged:
+        # pass {"force": true} as the event to republish an unchanged sheet
+        with metrics.stage('revision'):
+            revision = sheets.get_revision(os.environ['SHEET_ID'])
+            unchanged = sheets.is_unchanged(spec.output, revision)
+        if unchanged and not (event or {}).get('force'):
+            log.info('sheet unchanged since last run; skipping')
+            metrics.incr('run.skipped')
+            if (spec.layers or spec.archive) and not dry_run:
+                with metrics.stage('geojson'):
+                    features = fetch_geojson(spec)
+                publish_views(spec, features)
+            return
+
+    sheet = {}
+    for source in spec.sources:
+        with metrics.stage(source):
+            rows = SOURCES[source](spec, dry_run)
+            for row in rows.values():
+                dates.normalize(row['properties'])
+        metrics.incr('%s.rows' % source, len(rows))
+        sheet.update(rows)
+    with metrics.stage('geojson'):
+        dataset = get_geojson(spec)
+    metrics.incr('geojson.features', len(dataset))
+    keys = sheet.keys() - dataset.keys()
+    failed = []
+    if keys:
+        with metrics.stage('geocode'):
+            cache = geocode.GeocodeCache.load()
+            failed = get_geodata(spec, sheet, keys, cache=cache)
+            if not dry_run:
+                cache.save()
+    metrics.incr('geocode.keys', len(keys))
+    metrics.incr('geocode.failed', len(failed))
+    with metrics.stage('merge'):
+        dataset, changes = merge_data(sheet, dataset)
+    # the merged Features are all that's needed from here on
+    del sheet
+    for name, changed in changes._asdict().items():
+        metrics.incr('merge.%s' % name, len(changed))
+    photo_updates = []
+    if spec.photos:
+        with metrics.stage('photos'):
+            photo_updates = photos.update_photos(dataset, dry_run)
+    if changes.changed() or photo_updates:
+        with metrics.stage('upload'):
+            upload(spec, dataset, dry_run)
+    else:
+        log.info('no changes; skipping upload of %s', spec.output)
+    if not dry_run:
+        publish_views(spec, published_features(dataset))
+    if revision and not dry_run:
+        if failed:
+            # so the next run retries them instead of skipping
+            log.warning('%d rows failed to geocode; not saving sheet revision', len(failed))
+        else:
+            sheets.save_revision(spec.output, revision)
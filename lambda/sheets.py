@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+from typing import Dict, Iterator, List, Optional
+
+from googleapiclient.errors import HttpError
+
+import clients
+import metrics
+import store
+
+log = logging.getLogger(__name__)
+
+WATERMARKS = 'sheet_watermarks.json'
+PAGE_SIZE = 1000
+RANGE_RE = re.compile(
+    r'^(?:(?P<sheet>.+)!)?(?P<start_col>[A-Z]+)(?P<start_row>\d+):(?P<end_col>[A-Z]+)(?P<end_row>\d*)$')
+
+
+def get_revision(spreadsheet_id: str, service=None) -> Optional[Dict]:
+    '''
+    Drive version and modifiedTime for the spreadsheet, or None if Drive
+    won't tell us (in which case the sheet should be treated as changed)
+
+    version increases on every edit, so it catches changes that land in the
+    same second as the last run
+    '''
+    service = service or clients.drive()
+    try:
+        meta = service.files().get(
+            fileId=spreadsheet_id, fields='version,modifiedTime').execute()
+    except HttpError as err:
+        log.warning('unable to get revision for %s: %s', spreadsheet_id, err)
+        return None
+    return {
+        'spreadsheetId': spreadsheet_id,
+        'version': meta.get('version'),
+        'modifiedTime': meta.get('modifiedTime'),
+    }
+
+
+def is_unchanged(output: str, revision: Optional[Dict]) -> bool:
+    '''
+    True if output was last published from this exact sheet revision
+    '''
+    if not revision:
+        return False
+    last = store.load_json(WATERMARKS, {}).get(output)
+    log.info('sheet revision %s; last published %s from %s', revision, output, last)
+    return last == revision
+
+
+def save_revision(output: str, revision: Optional[Dict]) -> None:
+    if not revision:
+        return
+    watermarks = store.load_json(WATERMARKS, {})
+    watermarks[output] = revision
+    store.save_json(WATERMARKS, watermarks)
+
+
+def get_row_count(service, spreadsheet_id: str, sheet_name: str = None) -> int:
+    '''
+    number of rows in the sheet's grid (including trailing empty rows)
+    '''
+    result = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields='sheets(properties(title,gridProperties(rowCount)))').execute()
+    for sheet in result.get('sheets', []):
+        props = sheet['properties']
+        if sheet_name is None or props['title'] == sheet_name:
+            return props['gridProperties']['rowCount']
+    raise ValueError('no sheet %s in %s' % (sheet_name, spreadsheet_id))
+
+
+def iter_rows(spreadsheet_id: str, sheet_range: str, page_size: int = PAGE_SIZE,
+              service=None) -> Iterator[List[str]]:
+    '''
+    yield rows of sheet_range (e.g. Sheet1!A1:S), fetching page_size rows per
+    request so the whole sheet never has to be in memory at once
+
+    empty rows between rows with data are yielded as [], even across pages,
+    but trailing ones aren't. Every page up to the end of the range (or the
+    grid's rowCount) is read, since there can be data after a page of empty
+    rows
+    '''
+    match = RANGE_RE.match(sheet_range)
+    if not match:
+        raise ValueError('unsupported range %s' % sheet_range)
+    service = service or clients.sheets()
+    sheet_name = match.group('sheet')
+    prefix = '%s!' % sheet_name if sheet_name else ''
+    start = int(match.group('start_row'))
+    if match.group('end_row'):
+        last = int(match.group('end_row'))
+    else:
+        last = get_row_count(service, spreadsheet_id, sheet_name)
+    # empty rows not yielded yet, since the API leaves them off the end of a page
+    blank = 0
+    while start <= last:
+        end = min(start + page_size - 1, last)
+        window = '%s%s%d:%s%d' % (prefix, match.group('start_col'), start,
+                                  match.group('end_col'), end)
+        log.debug('load %s', window)
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=window).execute()
+        metrics.incr('sheet.pages')
+        # the client only gives us the parsed response, so this is its size
+        # as compact JSON rather than what came over the wire
+        metrics.incr('sheet.bytes', len(json.dumps(result, separators=(',', ':'))))
+        values = result.get('values', [])
+        if values:
+            for _ in range(blank):
+                yield []
+            blank = 0
+        for row in values:
+            yield row
+        blank += end - start + 1 - len(values)
+        start = end + 1
@@ -0,0 +1,133 @@
+'''
+nearest-feature lookup without scanning every feature
+
+points are kept in an implicit k-d tree: for any slice of the points array,
+the middle point splits the rest on axis depth % 3 of its position on the
+unit sphere (x, y, z). Straight-line distance between points on the sphere
+grows with great-circle distance, so pruning on it gives exact results.
+
+the serialized form ({'version': 1, 'points': [[lon, lat, key], ...]}) keeps
+that order, so a client can search it the same way
+'''
+import heapq
+import json
+from math import asin, cos, radians, sin, sqrt
+from typing import Dict, Iterable, List, Tuple
+
+# km; same as map.js
+EARTH_RADIUS = 6371
+VERSION = 1
+# same as the minified GeoJSON
+PRECISION = 5
+
+
+def to_xyz(lat: float, lon: float) -> Tuple[float, float, float]:
+    lat, lon = radians(lat), radians(lon)
+    return (cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat))
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
+    return 2 * EARTH_RADIUS * asin(min(1, sqrt(a)))
+
+
+def brute_force_nearest(points: Iterable[Tuple[float, float, str]], lat: float,
+                        lon: float, k: int = 1) -> List[Tuple[float, str]]:
+    '''
+    reference implementation: haversine distance to every (lon, lat, key)
+    '''
+    return heapq.nsmallest(
+        k, ((haversine(lat, lon, plat, plon), key) for plon, plat, key in points))
+
+
+class SpatialIndex:
+    def __init__(self, points: List[Tuple[float, float, str]]):
+        '''
+        points are (lon, lat, key), already in k-d order; see build
+        '''
+        self.points = points
+        self.xyz = [to_xyz(lat, lon) for lon, lat, _ in points]
+
+    @classmethod
+    def build(cls, points: Iterable[Tuple[float, float, str]]) -> 'SpatialIndex':
+        points = list(points)
+        xyz = [to_xyz(lat, lon) for lon, lat, _ in points]
+        order = list(range(len(points)))
+        stack = [(0, len(order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo < 2:
+                continue
+            axis = depth % 3
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: xyz[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+        return cls([points[i] for i in order])
+
+    @classmethod
+    def from_features(cls, features: Dict[str, Dict],
+                      precision: int = PRECISION) -> 'SpatialIndex':
+        '''
+        index {key: GeoJSON point feature}
+
+        coordinates are rounded before the tree is built, so the serialized
+        index searches exactly like this one
+        '''
+        return cls.build((round(feature['geometry']['coordinates'][0], precision),
+                          round(feature['geometry']['coordinates'][1], precision),
+                          key)
+                         for key, feature in features.items()
+                         if feature.get('geometry'))
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'SpatialIndex':
+        if data.get('version') != VERSION:
+            raise ValueError('unsupported index version %s' % data.get('version'))
+        return cls([tuple(point) for point in data['points']])
+
+    def to_json(self) -> Dict:
+        return {'version': VERSION, 'points': [list(point) for point in self.points]}
+
+    def dumps(self) -> str:
+        return json.dumps(self.to_json(), separators=(',', ':'))
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[float, str]]:
+        '''
+        [(distance in km, key)] of the k features closest to lat, lon, closest first
+        '''
+        query = to_xyz(lat, lon)
+        # max-heap of (-squared chord distance, index)
+        best = []
+        # (lo, hi, depth, squared distance to the slice's splitting plane)
+        stack = [(0, len(self.points), 0, 0)]
+        while stack:
+            lo, hi, depth, plane2 = stack.pop()
+            # the far side of a split can only help if its plane is closer
+            # than the worst match so far
+            if lo >= hi or (len(best) == k and plane2 >= -best[0][0]):
+                continue
+            mid = (lo + hi) // 2
+            point = self.xyz[mid]
+            dist2 = ((query[0] - point[0])**2 + (query[1] - point[1])**2 +
+                     (query[2] - point[2])**2)
+            if len(best) < k:
+                heapq.heappush(best, (-dist2, mid))
+            elif dist2 < -best[0][0]:
+                heapq.heapreplace(best, (-dist2, mid))
+            axis = depth % 3
+            diff = query[axis] - point[axis]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            stack.append((far[0], far[1], depth + 1, diff * diff))
+            # searched first
+            stack.append((near[0], near[1], depth + 1, 0))
+        return sorted((2 * EARTH_RADIUS * asin(min(1, sqrt(-dist2) / 2)),
+                       self.points[i][2]) for dist2, i in best)
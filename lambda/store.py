@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from botocore.exceptions import ClientError, ParamValidationError
+
+import clients
+import metrics
+
+log = logging.getLogger(__name__)
+
+BUCKET = 'ragtag-marchon'
+# pipeline state lives next to the published GeoJSON, but is not public
+STATE_PREFIX = 'state/'
+# S3 user metadata holding the digest of the published content
+DIGEST_KEY = 'content-digest'
+# error codes for a key that doesn't exist
+MISSING = ('404', 'NoSuchKey', 'NotFound')
+# without s3:ListBucket, S3 answers 403 for a key that doesn't exist too
+FORBIDDEN = ('403', 'AccessDenied')
+
+# botocore only knows the IfMatch/IfNoneMatch PutObject parameters since
+# 1.35; set False the first time an older one rejects them
+_conditional_puts = True
+
+
+def _error_code(err: ClientError) -> str:
+    return err.response.get('Error', {}).get('Code')
+
+
+def _state_path(name: str) -> str:
+    return os.path.join(os.environ['STATE_DIR'], name)
+
+
+def load_json(name: str, default=None):
+    '''
+    load a JSON state document; returns default if it doesn't exist yet
+
+    set STATE_DIR in environment to keep state in a local directory instead of S3
+    '''
+    metrics.incr('state.reads')
+    if os.environ.get('STATE_DIR'):
+        try:
+            with open(_state_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            log.info('no state found at %s', _state_path(name))
+            return default
+    try:
+        obj = clients.s3().Object(BUCKET, STATE_PREFIX + name).get()
+    except ClientError as err:
+        if _error_code(err) in MISSING:
+            log.info('no state found at %s%s', STATE_PREFIX, name)
+            return default
+        if _error_code(err) in FORBIDDEN:
+            log.warning('no state found at %s%s, or no permission to read it; '
+                        'needs s3:GetObject and s3:ListBucket (see README)', STATE_PREFIX, name)
+            return default
+        raise
+    return json.loads(obj['Body'].read())
+
+
+def save_json(name: str, data) -> None:
+    body = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    metrics.incr('state.writes')
+    metrics.incr('state.bytes', len(body))
+    if os.environ.get('STATE_DIR'):
+        os.makedirs(os.environ['STATE_DIR'], exist_ok=True)
+        with open(_state_path(name), 'w') as f:
+            f.write(body)
+        return
+    clients.s3().Object(BUCKET, STATE_PREFIX + name).put(
+        Body=body, ContentType='application/json')
+    log.info('saved %s%s (%d bytes)', STATE_PREFIX, name, len(body))
+
+
+def _put(obj, condition: dict, **params):
+    '''
+    obj.put(**params) with the condition parameters if botocore supports them
+    '''
+    global _conditional_puts
+    if _conditional_puts:
+        try:
+            return obj.put(**params, **condition)
+        except ParamValidationError:
+            log.warning('botocore has no conditional PutObject; writing unconditionally')
+            _conditional_puts = False
+    return obj.put(**params)
+
+
+def publish(key: str, body, content_type: str = 'application/json',
+            digest: str = None, expires: timedelta = timedelta(hours=6),
+            **extra) -> bool:
+    '''
+    public-read PUT of body to key, unless the object already holds content
+    with the same digest (md5 of body by default); returns True if written
+
+    leaving unchanged objects alone keeps their ETag, so browsers and CDNs
+    keep getting 304s. The PUT is conditional on the ETag we just read, so if
+    another run wrote the object in the meantime we leave its version in place
+    (if botocore supports conditional PUTs; otherwise the last write wins)
+    '''
+    if isinstance(body, str):
+        body = body.encode('utf8')
+    digest = digest or hashlib.md5(body).hexdigest()
+    obj = clients.s3().Object(BUCKET, key)
+    try:
+        obj.load()
+        if obj.metadata.get(DIGEST_KEY) == digest:
+            log.info('%s unchanged; skipping upload', key)
+            metrics.incr('publish.unchanged')
+            return False
+        condition = {'IfMatch': obj.e_tag}
+    except ClientError as err:
+        if _error_code(err) in MISSING:
+            condition = {'IfNoneMatch': '*'}
+        elif _error_code(err) in FORBIDDEN:
+            # missing, or there but not readable; either way we can't
+            # condition the write on it
+            log.warning('no permission to read %s; writing unconditionally '
+                        '(needs s3:GetObject and s3:ListBucket, see README)', key)
+            condition = {}
+        else:
+            raise
+    try:
+        response = _put(obj, condition,
+                        Body=body,
+                        ContentType=content_type,
+                        ACL='public-read',
+                        Expires=(datetime.now() + expires),
+                        Metadata={DIGEST_KEY: digest},
+                        **extra)
+    except ClientError as err:
+        if _error_code(err) in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            log.warning('%s was updated by another run; not overwriting', key)
+            return False
+        raise
+    log.debug(response)
+    metrics.incr('publish.objects')
+    metrics.incr('publish.bytes', len(body))
+    return True
@@ -1,8 +1,11 @@
 import pprint
+from datetime import datetime, timedelta, timezone
+
+import requests_mock
 
 from action_network import (convert_event, get_email_address_from_organizer,
-                            get_events_from_events_campaign, get_organizer,
-                            make_location)
+                            get_event_pages, get_events_from_events_campaign,
+                            get_organizer, make_location, sync_events)
 from action_network_sample_data import make_test_event, make_test_location
 
 
@@ -119,7 +122,122 @@ def test_convert_event():
     assert p['contactName'] == 'Larry Person'
 
 
+def make_page(page, total_pages):
+    event = make_test_event()
+    event['location']['postal_code'] = str(10000 + page)
+    event['identifiers'] = ['action_network:%d' % page]
+    return {'total_pages': total_pages, '_embedded': {'osdi:events': [event]}}
+
+
+def mock_pages(mock, total_pages, failed=()):
+    url = 'https://actionnetwork.org/api/v2/event_campaigns/123/events?page=%d'
+    for page in range(1, total_pages + 1):
+        if page in failed:
+            mock.get(url % page, status_code=500)
+        else:
+            mock.get(url % page, json=make_page(page, total_pages))
+
+
+def test_get_events_from_events_campaign(monkeypatch):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 12)
+        x = get_events_from_events_campaign()
+        assert mock.call_count == 12
+        assert mock.request_history[0].headers['OSDI-API-Token'] == 'key'
+    assert len(x) == 12
+    assert '10012::Larry Person' in x
+
+
+def test_get_events_partial(monkeypatch):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 3, failed=[2])
+        pages, failed = get_event_pages()
+        x = get_events_from_events_campaign()
+    assert failed == [2]
+    assert len(pages) == 2
+    assert sorted(x) == ['10001::Larry Person', '10003::Larry Person']
+
+
+def test_get_events_first_page_fails(monkeypatch):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 3, failed=[1])
+        assert get_event_pages() == ([], [1])
+
+
+def test_sync_events(monkeypatch, tmp_path):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    url = 'https://actionnetwork.org/api/v2/event_campaigns/123/events'
+    start = datetime(2019, 1, 10, 12, tzinfo=timezone.utc)
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 2)
+        x = sync_events(now=start)
+        assert 'filter' not in mock.last_request.qs
+    assert sorted(x) == ['10001::Larry Person', '10002::Larry Person']
+
+    first, second = make_page(1, 1), make_page(2, 1)
+    first['_embedded']['osdi:events'][0]['name'] = 'renamed'
+    second['_embedded']['osdi:events'][0]['status'] = 'cancelled'
+    first['_embedded']['osdi:events'] += second['_embedded']['osdi:events']
+    with requests_mock.Mocker() as mock:
+        mock.get(url, json=first)
+        x = sync_events(now=start + timedelta(hours=1))
+        assert mock.call_count == 1
+        assert mock.last_request.qs['filter'] == ["modified_date gt '2019-01-09'"]
+    assert list(x) == ['10001::Larry Person']
+    assert x['10001::Larry Person']['properties']['name'] == 'renamed'
+
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 1)
+        sync_events(now=start + timedelta(days=1))
+        assert 'filter' not in mock.last_request.qs
+
+
+def test_sync_events_failed_page(monkeypatch, tmp_path):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    start = datetime(2019, 1, 10, 12, tzinfo=timezone.utc)
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 1)
+        sync_events(now=start)
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 2, failed=[1])
+        x = sync_events(now=start + timedelta(days=2))
+    # full sync failed; keep what we had
+    assert list(x) == ['10001::Larry Person']
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 2)
+        sync_events(now=start + timedelta(days=2, hours=1))
+        # still a full sync, since the last one didn't finish
+        assert 'filter' not in mock.last_request.qs
+
+
+def test_sync_events_dry_run(monkeypatch, tmp_path):
+    monkeypatch.setenv('ACTION_NETWORK_EVENTS_CAMPAIGN_ID', '123')
+    monkeypatch.setenv('ACTION_NETWORK_API_KEY', 'key')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    start = datetime(2019, 1, 10, 12, tzinfo=timezone.utc)
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 1)
+        assert list(sync_events(now=start, dry_run=True)) == ['10001::Larry Person']
+    assert list(tmp_path.iterdir()) == []
+    with requests_mock.Mocker() as mock:
+        mock_pages(mock, 1)
+        sync_events(now=start + timedelta(hours=1))
+        # no snapshot was saved, so still a full sync
+        assert 'filter' not in mock.last_request.qs
+
+
 if __name__ == '__main__':
     the_events = get_events_from_events_campaign()
     pp = pprint.PrettyPrinter()
     pp.pprint(the_events)
+
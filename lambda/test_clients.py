@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+import clients
+import photos
+
+
+@pytest.fixture
+def built(monkeypatch):
+    calls = []
+
+    def fake_service(name, version):
+        calls.append((name, version))
+        return object()
+
+    clients.reset()
+    monkeypatch.setattr(clients, '_google_service', fake_service)
+    yield calls
+    clients.reset()
+
+
+def test_clients_reused(built):
+    assert clients.sheets() is clients.sheets()
+    assert clients.drive() is clients.drive()
+    assert built == [('sheets', 'v4'), ('drive', 'v3')]
+    assert clients.loaded() == {'sheets': True, 'drive': True, 's3': False, 'geocoder': False}
+
+
+def test_clients_per_thread(built):
+    main = clients.drive()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(clients.drive()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+    assert len(built) == 2
+
+
+def test_reset(built):
+    first = clients.sheets()
+    clients.reset()
+    assert clients.sheets() is not first
+
+
+def test_pool_threads_keep_clients(built):
+    pool = photos.get_pool()
+    assert photos.get_pool() is pool
+    for _ in range(3):
+        list(pool.map(lambda _: clients.drive(), range(20)))
+    # at most one Drive service per worker thread, however many runs
+    assert 0 < len(built) <= photos.WORKERS
+    clients.reset()
+    before = len(built)
+    list(pool.map(lambda _: clients.drive(), range(20)))
+    assert len(built) > before
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from compact import Feature, iter_features, to_geojson
+
+FEATURES = [
+    {'type': 'Feature', 'id': 'abc', 'properties': {'name': 'Märch', 'affiliate': False,
+                                                  'photoUrls': {'image/webp': 'a.webp 300w'}},
+     'geometry': {'type': 'Point', 'coordinates': [-73.98765, 40.7]}},
+    # sheet rows have no type or geometry
+    {'properties': {'name': 'Row', 'location': '10025'}},
+    {'geometry': None, 'properties': None, 'type': 'Feature', 'bbox': [0, 0, 1, 1]},
+    {'type': 'Feature', 'properties': {},
+     'geometry': {'type': 'Point', 'coordinates': [1, 2, 3]}},
+    {'type': 'Feature', 'properties': {'n': 12},
+     'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]}},
+]
+
+
+def test_round_trip():
+    for feature in FEATURES:
+        compact = Feature(feature)
+        assert compact.to_geojson() == feature
+        assert compact == feature and dict(compact) == feature
+        # same member order, so it serializes the same
+        assert json.dumps(compact, default=to_geojson) == json.dumps(feature)
+
+
+def test_shared_names():
+    a = Feature({'properties': {'name': 'a', 'city': 'x'}})
+    b = Feature({'properties': {'name': 'b', 'city': 'y'}})
+    assert a.names is b.names
+    assert a.members is b.members
+    assert b.prop('city') == 'y'
+    assert b.prop('state', '') == ''
+
+
+def test_reads_copy():
+    feature = Feature(FEATURES[0])
+    props = feature['properties']
+    props['name'] = 'changed'
+    assert feature.prop('name') == 'Märch'
+    feature['properties'] = props
+    assert feature.prop('name') == 'changed'
+    assert feature.get('geometry') == FEATURES[0]['geometry']
+    assert 'id' in feature and 'bbox' not in feature
+    assert feature.get('bbox') is None
+    with pytest.raises(KeyError):
+        feature['bbox']
+
+
+def test_iter_features():
+    data = {'type': 'FeatureCollection', 'generated': '2019-01-19', 'features': FEATURES,
+            'trailing': 12345}
+    for indent in (None, 2):
+        text = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf8')
+        # split anywhere, including inside a UTF-8 sequence or a number
+        for size in (1, 3, 64, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            assert list(iter_features(chunks)) == FEATURES
+    assert list(iter_features([b'{"type": "FeatureCollection", "features": []}'])) == []
+
+
+def test_iter_features_truncated():
+    with pytest.raises(ValueError):
+        list(iter_features([b'{"features": [{"type": "Feature"}']))
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+from dateutil import parser
+
+import dates
+
+
+def test_parse_date_iso():
+    x = dates.parse_date('2018-01-20T18:00:00Z')
+    assert x == datetime(2018, 1, 20, 18, tzinfo=timezone.utc)
+
+
+def test_parse_date_matches_dateutil():
+    for value in ['2018-01-20T18:00:00Z', '2018-01-20', '2018-01-20 09:30:00',
+                  '2018-01-20T18:00:00-05:00', '1/20/2018', 'January 20, 2018',
+                  '11/6/2018 ']:
+        assert dates.parse_date(value) == parser.parse(value), value
+
+
+def test_parse_date_invalid():
+    assert dates.parse_date('TBD') is None
+    # dateutil would fill the rest in from today
+    for value in ('Saturday', '2pm', '10', 'January 20', '2019'):
+        assert dates.parse_date(value) is None, value
+    assert dates.parse_date('January 20, 2019 2pm') == datetime(2019, 1, 20, 14)
+    assert dates.format_event_date('TBD') == 'TBD'
+
+
+def test_format_event_date():
+    assert dates.format_event_date('2018-01-20T18:00:00Z') == '1/20/2018'
+    assert dates.format_event_date('1/20/2018') == '1/20/2018'
+
+
+def test_normalize():
+    props = {'eventDate': '1/19/2019', 'startTime': '10am', 'endTime': '2:30 PM'}
+    dates.normalize(props)
+    assert props['eventStart'] == '2019-01-19T10:00:00'
+    assert props['eventEnd'] == '2019-01-19T14:30:00'
+    assert props['eventEpoch'] == 1547892000
+    # already normalized
+    dates.normalize(props)
+    assert props['eventStart'] == '2019-01-19T10:00:00'
+
+
+def test_normalize_action_network():
+    props = {'eventDate': '1/20/2018', 'eventStart': '2018-01-20T18:00:00Z'}
+    dates.normalize(props)
+    assert props['eventStart'] == '2018-01-20T18:00:00+00:00'
+    assert props['eventEpoch'] == 1516471200
+
+
+def test_normalize_unparseable():
+    props = {'eventDate': '1/19/2019', 'startTime': 'TBD'}
+    dates.normalize(props)
+    assert props['eventStart'] == '2019-01-19T00:00:00'
+    assert props['eventEnd'] == ''
+    # a date that no longer parses clears the last one
+    props = {'eventDate': 'TBD', 'eventStart': '', 'eventEpoch': 1547856000}
+    dates.normalize(props)
+    assert props['eventStart'] == '' and props['eventEpoch'] is None
+    # a time without a date doesn't become today
+    props = {'eventDate': 'Saturday', 'startTime': '2pm'}
+    dates.normalize(props)
+    assert props['eventStart'] == '' and props['eventEpoch'] is None
+    props = {'name': 'no dates'}
+    dates.normalize(props)
+    assert props == {'name': 'no dates'}
@@ -2,7 +2,9 @@ import json
 
 import requests_mock
 
+import datasets
 import marchon
+import pipeline
 '''
     set these in environment
 
@@ -46,18 +48,18 @@ def test_get_geojson():
         mock.get(
             'https://s3.amazonaws.com/ragtag-marchon/events.json',
             text=response_callback)
-        x = marchon.get_geojson('events.json')
+        x = pipeline.get_geojson(datasets.EVENTS)
         assert len(x) == 2
         assert 'New Paltz, NY' in x
         assert 'Des Moines, IA 50312::Mark Langgin' in x
 
 
 def test_get_location_from_key():
-    x = marchon.get_location_from_key('New York, NY 10025::Larry Person')
+    x = datasets.get_location_from_key('New York, NY 10025::Larry Person')
     assert x == 'New York, NY 10025'
-    x = marchon.get_location_from_key('New York, NY 10025:Larry Person')
+    x = datasets.get_location_from_key('New York, NY 10025:Larry Person')
     assert x == 'New York, NY 10025:Larry Person'
-    x = marchon.get_location_from_key('New York, NY 10025')
+    x = datasets.get_location_from_key('New York, NY 10025')
     assert x == 'New York, NY 10025'
 
 
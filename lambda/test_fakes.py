@@ -0,0 +1,119 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+import requests
+
+import datasets
+import fakes
+import pipeline
+
+
+def published(fake, key):
+    return json.loads(fake['s3'].Object(pipeline.store.BUCKET, key).get()['Body'].read())
+
+
+def test_offline_run(tmp_path, capsys):
+    spec = datasets.EVENTS
+    rows = fakes.make_rows(spec, 20)
+    with fakes.offline(str(tmp_path), rows, fakes.make_event_pages(30)) as fake:
+        pipeline.run(spec)
+        assert len(published(fake, 'events.json')['features']) == 50
+        assert len(published(fake, 'events.index.json')['points']) == 50
+        assert fake['geocoder'].calls == 50
+        manifest = published(fake, 'events.layers.json')
+        assert [(layer['id'], layer['count']) for layer in manifest['layers']] == [
+            ('marchon-affiliate-true', 10), ('marchon-affiliate-false', 10), ('actionnetwork', 30)]
+        archive = published(fake, 'events.archive.json')
+        assert archive['upcoming']['count'] == 50 and archive['months'] == []
+
+        # nothing new to geocode or publish
+        pipeline.run(spec)
+        assert fake['geocoder'].calls == 50
+        record = json.loads(capsys.readouterr().out.splitlines()[-1])
+        assert record['merge.unchanged'] == 50
+        assert 'publish.objects' not in record
+
+
+def test_offline_skip_unchanged(tmp_path, capsys):
+    spec = datasets.MARCHONPOLLS
+    with fakes.offline(str(tmp_path), fakes.make_rows(spec, 10)) as fake:
+        pipeline.run(spec)
+        archive = fake['s3'].Object(pipeline.store.BUCKET, 'marchonpolls_events.pmtiles').get()
+        assert archive['Body'].read(7) == b'PMTiles'
+        pipeline.run(spec)
+        fake['drive'].version = '2'
+        pipeline.run(spec)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record.get('run.skipped') for record in records] == [None, 1, None]
+    assert records[0]['geocode.api_calls'] == 10
+
+
+def test_offline_skipped_run_rolls_over(tmp_path, capsys, monkeypatch):
+    spec = datasets.MARCHONPOLLS
+    with fakes.offline(str(tmp_path), fakes.make_rows(spec, 10)) as fake:
+        pipeline.run(spec)
+        manifest = published(fake, 'marchonpolls_events.layers.json')
+        assert [layer['count'] for layer in manifest['layers']] == [10]
+
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        monkeypatch.setattr(pipeline.outputs, 'date', Tomorrow)
+        pipeline.run(spec)
+        # the first event is past now, even though the sheet hasn't changed
+        manifest = published(fake, 'marchonpolls_events.layers.json')
+        assert [layer['count'] for layer in manifest['layers']] == [9]
+        archive = published(fake, 'marchonpolls_events.archive.json')
+        assert archive['upcoming']['count'] == 9
+        assert [month['count'] for month in archive['months']] == [1]
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert records[1]['run.skipped'] == 1
+
+
+def test_offline_geocode_errors_not_skipped(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(pipeline.geocode.time, 'sleep', lambda seconds: None)
+    spec = datasets.MARCHONPOLLS
+    with fakes.offline(str(tmp_path), fakes.make_rows(spec, 10)) as fake:
+        forward = fake['geocoder'].forward
+        down = {'4 Main St, Town 3,NY', 'Town 3,NY'}
+
+        def flaky(query, **kwargs):
+            if query in down:
+                raise requests.exceptions.ConnectionError()
+            return forward(query, **kwargs)
+
+        fake['geocoder'].forward = flaky
+        pipeline.run(spec)
+        down.clear()
+        # the sheet hasn't changed, but a row is still missing
+        pipeline.run(spec)
+        pipeline.run(spec)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record.get('run.skipped') for record in records] == [None, None, 1]
+    assert records[0]['geocode.failed'] == 1
+    assert records[1]['merge.added'] == 1
+
+
+def test_offline_partial_upload_retried(tmp_path, monkeypatch):
+    spec = datasets.MARCHONPOLLS
+    with fakes.offline(str(tmp_path), fakes.make_rows(spec, 10)) as fake:
+        make_archive = pipeline.tiles.make_archive
+
+        def broken(*args):
+            raise RuntimeError('tiles')
+
+        monkeypatch.setattr(pipeline.tiles, 'make_archive', broken)
+        with pytest.raises(RuntimeError):
+            pipeline.run(spec)
+        # the main GeoJSON is published last, so it's still missing
+        with pytest.raises(pipeline.store.ClientError):
+            published(fake, 'marchonpolls_events.json')
+
+        monkeypatch.setattr(pipeline.tiles, 'make_archive', make_archive)
+        pipeline.run(spec)
+        assert len(published(fake, 'marchonpolls_events.json')['features']) == 10
+        archive = fake['s3'].Object(pipeline.store.BUCKET, 'marchonpolls_events.pmtiles').get()
+        assert archive['Body'].read(7) == b'PMTiles'
@@ -0,0 +1,211 @@
+import time
+
+import requests
+import requests_mock
+from mapbox import Geocoder
+
+import geocode
+
+
+class FakeResponse:
+    def __init__(self, features, status_code=200):
+        self.features = features
+        self.status_code = status_code
+        self.headers = {}
+
+    def geojson(self):
+        return {'type': 'FeatureCollection', 'features': self.features}
+
+
+class FakeGeocoder:
+    def __init__(self, features=None, status_code=200):
+        self.features = features if features is not None else [{
+            'geometry': {'type': 'Point', 'coordinates': [-73.9, 40.8]},
+            'relevance': 0.9,
+            'place_name': '10025, New York, New York, United States',
+            'id': 'postcode.123',
+        }]
+        self.status_code = status_code
+        self.calls = []
+
+    def forward(self, address, **kwargs):
+        self.calls.append(address)
+        status_code = self.status_code
+        if isinstance(status_code, list):
+            status_code = status_code.pop(0)
+        return FakeResponse(self.features, status_code)
+
+
+def test_make_cache_key_normalizes():
+    assert geocode.make_cache_key(' New  York, NY ', ['us', 'ca']) == \
+        geocode.make_cache_key('new york, ny', ['ca', 'us'])
+    assert geocode.make_cache_key('10025', ['us']) != \
+        geocode.make_cache_key('10025', ['us'], ['place'])
+
+
+def test_forward_caches_result():
+    geocoder = FakeGeocoder()
+    cache = geocode.GeocodeCache()
+    x = geocode.forward(geocoder, cache, '10025', countries=['us'])
+    assert x['relevance'] == 0.9
+    assert 'id' not in x
+    y = geocode.forward(geocoder, cache, '10025 ', countries=['us'])
+    assert y == x
+    assert geocoder.calls == ['10025']
+
+
+def test_forward_caches_miss():
+    geocoder = FakeGeocoder(features=[])
+    cache = geocode.GeocodeCache()
+    assert geocode.forward(geocoder, cache, 'nowhere') is None
+    assert geocode.forward(geocoder, cache, 'nowhere') is None
+    assert len(geocoder.calls) == 1
+
+
+def test_forward_does_not_cache_errors():
+    geocoder = FakeGeocoder(status_code=401)
+    cache = geocode.GeocodeCache()
+    assert geocode.forward(geocoder, cache, '10025') is None
+    assert geocode.forward(geocoder, cache, '10025') is None
+    assert len(geocoder.calls) == 2
+    assert not cache.entries
+
+
+def test_expired_entry_is_a_miss():
+    cache = geocode.GeocodeCache()
+    cache.put('10025||', None)
+    cache.entries['10025||']['expires'] = 0
+    assert cache.get('10025||') == (False, None)
+
+
+def test_save_and_load(tmp_path, monkeypatch):
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    cache = geocode.GeocodeCache()
+    geocode.forward(FakeGeocoder(), cache, '10025')
+    cache.put('expired||', None)
+    cache.entries['expired||']['expires'] = 0
+    cache.save()
+    loaded = geocode.GeocodeCache.load()
+    assert list(loaded.entries) == ['10025||']
+
+
+def test_request_retries_rate_limit():
+    geocoder = FakeGeocoder(status_code=[429, 503, 200])
+    resp = geocode._request(lambda: geocoder.forward('10025'), '10025', backoff=0)
+    assert resp.status_code == 200
+    assert len(geocoder.calls) == 3
+
+
+def test_request_gives_up():
+    geocoder = FakeGeocoder(status_code=500)
+    resp = geocode._request(
+        lambda: geocoder.forward('10025'), '10025', retries=2, backoff=0)
+    assert resp.status_code == 500
+    assert len(geocoder.calls) == 3
+
+
+def test_request_retries_request_errors():
+    geocoder = FakeGeocoder()
+    errors = [requests.exceptions.ReadTimeout('stalled'),
+              requests.exceptions.ChunkedEncodingError('cut off')]
+
+    def send():
+        if errors:
+            raise errors.pop(0)
+        return geocoder.forward('10025')
+
+    resp = geocode._request(send, '10025', backoff=0)
+    assert resp.status_code == 200
+
+    def stalled():
+        raise requests.exceptions.ReadTimeout('stalled')
+
+    assert geocode._request(stalled, '10025', retries=1, backoff=0) is None
+
+
+def test_set_timeout(monkeypatch):
+    sent = []
+
+    def send(self, request, **kwargs):
+        sent.append(kwargs['timeout'])
+        raise requests.exceptions.ConnectionError()
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, 'send', send)
+    service = geocode.set_timeout(Geocoder(access_token='pk.test'))
+    for timeout in (None, 1):
+        try:
+            service.session.get('https://api.mapbox.com/', timeout=timeout)
+        except requests.exceptions.ConnectionError:
+            pass
+    assert sent == [geocode.TIMEOUT, 1]
+
+
+def test_token_bucket_limits_rate():
+    limiter = geocode.TokenBucket(rate=100, burst=5)
+    start = time.monotonic()
+    for _ in range(15):
+        limiter.acquire()
+    # 5 from the burst, then 10 at 100/s
+    assert time.monotonic() - start >= 0.09
+
+
+def test_executor_map():
+    geocoder = FakeGeocoder()
+    executor = geocode.GeocodeExecutor(geocoder, rate=1000, burst=10, workers=4)
+    x = executor.map({'a': '10025', 'b': '10025', 'c': 'New York'})
+    assert set(x) == {'a', 'b', 'c'}
+    assert x['a'] == x['b']
+    assert sorted(geocoder.calls) == ['10025', 'New York']
+
+
+def make_collection(relevance):
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'geometry': {'type': 'Point', 'coordinates': [-73.9, 40.8]},
+            'relevance': relevance,
+            'place_name': 'New York, New York, United States',
+        }] if relevance else []
+    }
+
+
+def test_batch_forward():
+    geocoder = Geocoder(access_token='pk.test')
+    cache = geocode.GeocodeCache()
+    cache.put(geocode.make_cache_key('cached', ['us']), None)
+    with requests_mock.Mocker() as mock:
+        mock.get(
+            requests_mock.ANY,
+            json=[make_collection(0.9), make_collection(None)])
+        x = geocode.batch_forward(
+            geocoder, cache, ['New York; NY', 'cached', 'nowhere'], ['us'])
+        assert mock.call_count == 1
+        url = mock.request_history[0].url
+        assert '/mapbox.places-permanent/New%20York%20%20NY;nowhere.json' in url
+        assert 'country=us' in url
+    assert x[0]['relevance'] == 0.9
+    assert x[1] is None
+    assert x[2] is None
+    assert cache.get(geocode.make_cache_key('nowhere', ['us'])) == (True, None)
+
+
+def test_batch_forward_single():
+    geocoder = Geocoder(access_token='pk.test')
+    with requests_mock.Mocker() as mock:
+        mock.get(requests_mock.ANY, json=make_collection(0.8))
+        x = geocode.batch_forward(geocoder, geocode.GeocodeCache(), ['10025'])
+    assert x[0]['relevance'] == 0.8
+
+
+def test_executor_map_batch():
+    geocoder = Geocoder(access_token='pk.test')
+    executor = geocode.GeocodeExecutor(geocoder, rate=1000, burst=10, batch=True)
+    queries = {str(i): 'place %d' % i for i in range(geocode.BATCH_SIZE + 1)}
+    with requests_mock.Mocker() as mock:
+        mock.get(
+            requests_mock.ANY,
+            json=lambda request, _: [make_collection(0.9)] * (
+                request.url.count(';') + 1))
+        x = executor.map(queries)
+        assert mock.call_count == 2
+    assert all(x[key]['relevance'] == 0.9 for key in queries)
@@ -0,0 +1,65 @@
+from datetime import date
+
+import layers
+
+
+def feature(**props):
+    return {'properties': props}
+
+
+def test_layer_for():
+    assert layers.layer_for({'source': 'events', 'affiliate': True}) == 'marchon-affiliate-true'
+    assert layers.layer_for({'source': 'events', 'affiliate': 'No'}) == 'marchon-affiliate-false'
+    assert layers.layer_for({'source': 'events', 'affiliate': False}) == 'marchon-affiliate-false'
+    assert layers.layer_for({'source': 'actionnetwork', 'affiliate': False}) == 'actionnetwork'
+    assert layers.layer_for({'flagship': 'Yes'}) == 'marchonpolls-flagship-events'
+    assert layers.layer_for({'flagship': ''}) == 'marchonpolls-events'
+    assert layers.layer_for({'city': 'Boston'}) == 'marchon-family-sep-events'
+    assert layers.layer_for({'affiliate': True}) is None
+
+
+def test_split():
+    features = [
+        feature(source='events', affiliate=True),
+        feature(source='actionnetwork'),
+        feature(source='events', affiliate=True),
+    ]
+    split = layers.split(features)
+    assert list(split) == ['marchon-affiliate-true', 'actionnetwork']
+    assert split['marchon-affiliate-true'] == [features[0], features[2]]
+
+
+def event(name, when, **props):
+    return feature(name=name, eventDate=when, **props)
+
+
+def test_partition():
+    today = date(2019, 1, 19)
+    features = [
+        event('later', '2/1/2019', source='actionnetwork'),
+        event('today', '1/19/2019', source='actionnetwork'),
+        event('past', '1/18/2019', source='actionnetwork'),
+        event('undated', '', source='actionnetwork'),
+        event('b', '1/20/2019', city='Boston'),
+        event('a', '1/20/2019', city='Austin'),
+        event('gone', '6/30/2018', city='Denver'),
+    ]
+    names = {
+        layer: [f['properties']['name'] for f in layer_features]
+        for layer, layer_features in layers.partition(features, today).items()
+    }
+    assert names == {
+        'actionnetwork': ['past', 'today', 'later', 'undated'],
+        'marchon-family-sep-events': ['a', 'b'],
+        'marchon-family-sep-events-past': ['gone'],
+    }
+    names = {
+        layer: [f['properties']['name'] for f in layer_features]
+        for layer, layer_features in layers.partition(features, today, upcoming_only=True).items()
+    }
+    # past family separation events still get their own layer
+    assert names == {
+        'actionnetwork': ['today', 'later'],
+        'marchon-family-sep-events': ['a', 'b'],
+        'marchon-family-sep-events-past': ['gone'],
+    }
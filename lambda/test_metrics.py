@@ -0,0 +1,56 @@
+import json
+import threading
+
+import datasets
+import metrics
+import pipeline
+
+
+def test_incr_and_stage():
+    m = metrics.Metrics()
+    with m.stage('geocode'):
+        m.incr('geocode.api_calls')
+    threads = [threading.Thread(target=m.incr, args=('geocode.api_calls', )) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert m.values['geocode.api_calls'] == 11
+    assert m.values['geocode.time'] >= 0
+
+
+def test_to_emf():
+    m = metrics.Metrics()
+    m.incr('upload.time', 12.5)
+    m.incr('publish.bytes', 2048)
+    m.incr('geocode.cache_hits', 3)
+    record = m.to_emf({'Dataset': 'events.json'}, timestamp=1516406400)
+    directive = record['_aws']['CloudWatchMetrics'][0]
+    assert record['_aws']['Timestamp'] == 1516406400000
+    assert directive['Namespace'] == metrics.NAMESPACE
+    assert directive['Dimensions'] == [['Dataset']]
+    assert directive['Metrics'] == [
+        {'Name': 'geocode.cache_hits', 'Unit': 'Count'},
+        {'Name': 'publish.bytes', 'Unit': 'Bytes'},
+        {'Name': 'upload.time', 'Unit': 'Milliseconds'},
+    ]
+    assert record['Dataset'] == 'events.json'
+    assert record['publish.bytes'] == 2048
+
+
+def test_run_emits_one_record(monkeypatch, capsys):
+    monkeypatch.setenv('SHEET_ID', 'sheet')
+    monkeypatch.setattr(pipeline.sheets, 'get_revision', lambda sheet_id: {'version': '1'})
+    monkeypatch.setattr(pipeline.sheets, 'is_unchanged', lambda output, revision: True)
+    monkeypatch.setattr(pipeline, 'fetch_geojson', lambda spec: [])
+    views = []
+    monkeypatch.setattr(pipeline, 'publish_views', lambda spec, features: views.append(spec))
+    pipeline.run(datasets.MARCHONPOLLS)
+    # layers are still refreshed
+    assert views == [datasets.MARCHONPOLLS]
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record['Dataset'] == datasets.MARCHONPOLLS.output
+    assert record['run.skipped'] == 1
+    assert 'revision.time' in record and 'run.time' in record
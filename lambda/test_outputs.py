@@ -0,0 +1,126 @@
+import gzip
+import json
+from datetime import date
+
+import outputs
+from compact import Feature
+
+
+def make_collection():
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'properties': {'name': 'New Paltz', 'twitter': '', 'affiliate': False},
+            'geometry': {'type': 'Point', 'coordinates': [-74.0834234567, 41.7475987654]},
+        }]
+    }
+
+
+def test_minify():
+    data = make_collection()
+    x = outputs.minify(data)
+    feature = x['features'][0]
+    assert feature['properties'] == {'name': 'New Paltz', 'affiliate': False}
+    assert feature['geometry']['coordinates'] == [-74.08342, 41.7476]
+    # original is untouched
+    assert data['features'][0]['properties']['twitter'] == ''
+
+
+def test_minify_keeps_flagship():
+    data = make_collection()
+    # map.js tells poll events apart by flagship being there at all
+    data['features'][0]['properties'].update(flagship='', source='')
+    props = outputs.minify(data)['features'][0]['properties']
+    assert props['flagship'] == '' and props['source'] == ''
+
+
+def test_encode_collection():
+    data = make_collection()
+    data['generated'] = '2019-01-19T00:00:00'
+    data['features'].append({'properties': {'name': 'Café'}})
+    compact = dict(data, features=[Feature(feature) for feature in data['features']])
+    assert outputs.encode_collection(compact, indent=2) == json.dumps(data, indent=2).encode()
+    assert outputs.encode_collection(compact) == \
+        json.dumps(data, separators=(',', ':')).encode()
+    empty = dict(data, features=[])
+    assert outputs.encode_collection(empty, indent=2) == json.dumps(empty, indent=2).encode()
+
+
+def test_gzip_compress():
+    body = b'{"features":[]}' * 100
+    compressed = outputs.gzip_compress(body)
+    assert gzip.decompress(compressed) == body
+    # no timestamp, so unchanged content isn't re-uploaded
+    assert compressed[4:8] == b'\0\0\0\0'
+    assert outputs.gzip_compress(body) == compressed
+
+
+def test_make_variants():
+    data = make_collection()
+    variants = {key: (body, encoding)
+                for key, body, _, encoding in outputs.make_variants('events.json', data)}
+    body, encoding = variants['events.min.json']
+    assert encoding is None
+    assert json.loads(body) == outputs.minify(data)
+    body, encoding = variants['events.min.json.gz']
+    assert encoding == 'gzip'
+    assert json.loads(gzip.decompress(body)) == outputs.minify(data)
+    # compressed output is stable so unchanged content isn't re-uploaded
+    assert outputs.make_variants('events.json', data)[1][1] == body
+
+
+def test_make_layers():
+    data = make_collection()
+    data['features'].append({
+        'type': 'Feature',
+        'properties': {'name': 'March', 'source': 'actionnetwork', 'eventDate': '1/20/2019'},
+        'geometry': {'type': 'Point', 'coordinates': [-73.9, 40.8]},
+    })
+    data['features'].append({
+        'type': 'Feature',
+        'properties': {'name': 'Old', 'source': 'actionnetwork', 'eventDate': '1/20/2018'},
+        'geometry': {'type': 'Point', 'coordinates': [-70, 42]},
+    })
+    manifest, bodies = outputs.make_layers('events.json', data, date(2019, 1, 19),
+                                           upcoming_only=True)
+    assert manifest == {
+        'date': '2019-01-19',
+        'layers': [{
+            'id': 'actionnetwork',
+            'key': 'events.actionnetwork.json',
+            'count': 1,
+            'bounds': [-73.9, 40.8, -73.9, 40.8],
+        }],
+    }
+    key, body = bodies[0]
+    assert key == 'events.actionnetwork.json'
+    assert [f['properties']['name'] for f in json.loads(body)['features']] == ['March']
+
+
+def test_make_archive():
+    data = make_collection()
+    for name, when in [('Next', '2/1/2019'), ('Late', '1/30/2018'), ('Early', '1/2/2018'),
+                       ('Last', '12/31/2018'), ('Today', '1/19/2019')]:
+        data['features'].append({
+            'type': 'Feature',
+            'properties': {'name': name, 'eventDate': when},
+            'geometry': {'type': 'Point', 'coordinates': [-70, 42]},
+        })
+    manifest, bodies = outputs.make_archive('events.json', data, date(2019, 1, 19))
+    assert manifest == {
+        'date': '2019-01-19',
+        'upcoming': {'key': 'events.upcoming.json', 'count': 3},
+        'months': [
+            {'month': '2018-01', 'key': 'events.2018-01.json', 'count': 2},
+            {'month': '2018-12', 'key': 'events.2018-12.json', 'count': 1},
+        ],
+    }
+    names = {key: [f['properties']['name'] for f in json.loads(body)['features']]
+             for key, body in bodies}
+    assert names == {
+        # undated events stay in upcoming, last
+        'events.upcoming.json': ['Today', 'Next', 'New Paltz'],
+        'events.2018-01.json': ['Early', 'Late'],
+        'events.2018-12.json': ['Last'],
+    }
@@ -0,0 +1,177 @@
+import io
+
+import pytest
+from PIL import Image
+
+import clients
+import photos
+import store
+from compact import Feature
+from fakes import FakeDrive
+from test_store import FakeS3
+
+
+@pytest.fixture
+def drive(monkeypatch, tmp_path):
+    fake = FakeDrive()
+    monkeypatch.setenv('PHOTO_FOLDER_ID', 'folder')
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    monkeypatch.setattr(clients, 'drive', lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(clients, 's3', lambda: fake)
+    return fake
+
+
+def make_dataset():
+    return {
+        'a': {'properties': {'photo': 'a.jpg'}},
+        'b': {'properties': {'photo': 'b.jpg'}},
+        'c': {'properties': {'photo': ''}},
+    }
+
+
+def test_update_photos(drive, s3):
+    drive.add('1', 'a.jpg', 'aaa')
+    drive.add('2', 'b.jpg', 'bbb')
+    drive.add('3', 'unused.jpg', 'ccc')
+    dataset = make_dataset()
+    dataset['c']['properties']['photoUrls'] = {'image/jpeg': 'old.jpeg 600w'}
+    assert sorted(photos.update_photos(dataset)) == ['a', 'b']
+    props = dataset['a']['properties']
+    assert props['photoUrl'] == 'https://s3.amazonaws.com/ragtag-marchon/aaa-600.jpeg'
+    assert props['photoUrls']['image/jpeg'] == ', '.join([
+        'https://s3.amazonaws.com/ragtag-marchon/aaa-150.jpeg 150w',
+        'https://s3.amazonaws.com/ragtag-marchon/aaa-300.jpeg 300w',
+        'https://s3.amazonaws.com/ragtag-marchon/aaa-600.jpeg 600w',
+    ])
+    assert dataset['c']['properties']['photoUrl'] == ''
+    assert 'photoUrls' not in dataset['c']['properties']
+    assert sorted(drive.downloads) == ['1', '2']
+    resized = Image.open(s3.objects['aaa-600.jpeg']['Body'])
+    assert resized.size == (600, 400)
+    assert Image.open(s3.objects['aaa-150.jpeg']['Body']).size == (150, 100)
+
+
+def test_update_photos_features(drive, s3):
+    drive.add('1', 'a.jpg', 'aaa')
+    # as merge_data returns them
+    dataset = {key: Feature(feature) for key, feature in make_dataset().items()}
+    assert sorted(photos.update_photos(dataset)) == ['a']
+    assert dataset['a']['properties']['photoUrl'].endswith('/aaa-600.jpeg')
+    assert dataset['c']['properties']['photoUrl'] == ''
+
+
+def test_update_photos_uses_manifest(drive, s3):
+    drive.add('1', 'a.jpg', 'aaa')
+    drive.add('2', 'b.jpg', 'aaa')
+    photos.update_photos(make_dataset())
+    # same bytes under two names are only resized once
+    assert len(drive.downloads) == 1
+    puts = len(s3.puts)
+
+    # a later run with the photoUrls lost doesn't redo any work
+    dataset = make_dataset()
+    assert sorted(photos.update_photos(dataset)) == ['a', 'b']
+    assert len(drive.downloads) == 1
+    assert len(s3.puts) == puts
+    assert dataset['b']['properties']['photoUrl'].endswith('/aaa-600.jpeg')
+    assert photos.update_photos(dataset) == []
+
+
+def test_update_photos_dry_run(drive, s3):
+    drive.add('1', 'a.jpg', 'aaa')
+    drive.add('2', 'b.jpg', 'bbb')
+    photos.update_photos(make_dataset(), dry_run=True)
+    assert drive.downloads == [] and s3.puts == []
+    assert store.load_json(photos.MANIFEST) is None
+
+    # photos already resized are still filled in
+    photos.update_photos({'a': {'properties': {'photo': 'a.jpg'}}})
+    puts = len(s3.puts)
+    dataset = make_dataset()
+    assert photos.update_photos(dataset, dry_run=True) == ['a']
+    assert dataset['a']['properties']['photoUrl'].endswith('/aaa-600.jpeg')
+    assert 'photoUrl' not in dataset['b']['properties']
+    assert drive.downloads == ['1'] and len(s3.puts) == puts
+
+
+def test_update_photos_upgrades_manifest(drive, s3):
+    store.save_json(photos.MANIFEST, {'aaa': 'aaa.jpeg'})
+    drive.add('1', 'a.jpg', 'aaa')
+    dataset = make_dataset()
+    assert photos.update_photos(dataset) == ['a']
+    assert drive.downloads == ['1']
+    assert store.load_json(photos.MANIFEST)['aaa']['fallback'] == 'aaa-600.jpeg'
+
+
+def test_iter_folder_pages(drive):
+    for i in range(5):
+        drive.file_list.append({'id': str(i), 'name': '%s.jpg' % i})
+    files = list(photos.iter_folder('folder', drive, page_size=2))
+    assert [f['id'] for f in files] == ['0', '1', '2', '3', '4']
+    assert drive.lists == [None, '2', '4']
+
+
+def test_index_by_name_keeps_newest():
+    files = [
+        {'id': '1', 'name': 'a.jpg', 'modifiedTime': '2018-01-21T00:00:00.000Z'},
+        {'id': '2', 'name': 'a.jpg', 'modifiedTime': '2018-01-20T00:00:00.000Z'},
+        {'id': '3', 'name': 'b.jpg', 'modifiedTime': '2018-01-20T00:00:00.000Z'},
+        {'id': '4', 'name': 'b.jpg', 'modifiedTime': '2018-01-22T00:00:00.000Z'},
+    ]
+    index = photos.index_by_name(files)
+    assert index['a.jpg']['id'] == '1'
+    assert index['b.jpg']['id'] == '4'
+
+
+def test_make_derivatives():
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (400, 200), 'red').save(img_bytes, format='JPEG')
+    derivatives = photos.make_derivatives(img_bytes.getvalue())
+    formats = photos.derivative_formats()
+    assert formats[-1] == photos.JPEG
+    # no upscaling past the original width
+    assert sorted({width for width, _, _ in derivatives}) == [150, 300, 400]
+    assert len(derivatives) == 3 * len(formats)
+    for width, fmt, body in derivatives:
+        img = Image.open(body)
+        assert img.format == fmt[0]
+        assert img.size == (width, width // 2)
+
+
+def test_make_derivatives_old_pillow(monkeypatch):
+    # Pillow 6.2 (pinned in Pipfile.lock) has no Image.reduce or reducing_gap
+    resize = Image.Image.resize
+
+    def old_resize(self, size, resample=Image.NEAREST, box=None):
+        return resize(self, size, resample, box)
+
+    monkeypatch.delattr(Image.Image, 'reduce')
+    monkeypatch.setattr(Image.Image, 'resize', old_resize)
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (1200, 800), 'red').save(img_bytes, format='JPEG')
+    derivatives = photos.make_derivatives(img_bytes.getvalue())
+    assert [Image.open(body).size for _, fmt, body in derivatives if fmt == photos.JPEG] == [
+        (600, 400), (300, 200), (150, 100)]
+
+
+def test_make_derivatives_alpha():
+    img_bytes = io.BytesIO()
+    Image.new('RGBA', (1000, 500), 'red').save(img_bytes, format='PNG')
+    derivatives = photos.make_derivatives(img_bytes.getvalue(), widths=(600, ))
+    _, fmt, body = derivatives[-1]
+    assert fmt == photos.PNG
+    assert Image.open(body).mode == 'RGBA'
+
+
+def test_make_derivatives_draft():
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (4000, 3000), 'red').save(img_bytes, format='JPEG')
+    derivatives = photos.make_derivatives(img_bytes.getvalue())
+    assert [Image.open(body).size for _, fmt, body in derivatives if fmt == photos.JPEG] == [
+        (600, 450), (300, 225), (150, 112)]
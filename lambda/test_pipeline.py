@@ -0,0 +1,160 @@
+import hashlib
+import json
+
+import requests
+
+import clients
+import datasets
+import pipeline
+from compact import Feature
+from test_geocode import FakeResponse
+
+
+class FakeGeocoder:
+    '''
+    returns a feature with the given relevance for each known query
+    '''
+
+    def __init__(self, relevance):
+        self.relevance = relevance
+        self.calls = []
+
+    def forward(self, address, **kwargs):
+        self.calls.append(address)
+        if address not in self.relevance:
+            return FakeResponse([])
+        return FakeResponse([{
+            'geometry': {'type': 'Point', 'coordinates': [-73.9, 40.8]},
+            'relevance': self.relevance[address],
+            'place_name': '%s, Springfield, Illinois, United States' % address,
+        }])
+
+
+def fake_rows(rows):
+    def iter_rows(spreadsheet_id, sheet_range):
+        return iter(rows)
+    return iter_rows
+
+
+def test_read_sheet_by_location(monkeypatch):
+    monkeypatch.setenv('SHEET_ID', 'abc')
+    monkeypatch.setattr(pipeline.sheets, 'iter_rows', fake_rows([
+        ['header'],
+        ['', '1/20/2018', 'http://example.com', 'New Paltz, NY', 'Host', 'Y'],
+        ['no location'],
+        ['Blank', '1/20/2018', '', ' '],
+    ]))
+    x = pipeline.read_sheet(datasets.EVENTS)
+    assert list(x) == ['New Paltz, NY']
+    props = x['New Paltz, NY']['properties']
+    assert props['name'] == 'New Paltz, NY Event'
+    assert props['source'] == 'events'
+    assert props['affiliate'] is True
+    assert props['instagram'] == ''
+
+
+def test_read_sheet_by_ident(monkeypatch):
+    monkeypatch.setenv('SHEET_ID', 'abc')
+    row = [''] * 21
+    row[10] = '1 Main St'
+    row[11] = 'Springfield'
+    row[12] = 'IL'
+    row[14] = '11/6/2018'
+    row[20] = 'Yes'
+    monkeypatch.setattr(pipeline.sheets, 'iter_rows',
+                        fake_rows([['header'], row, ['too short']]))
+    x = pipeline.read_sheet(datasets.MARCHONPOLLS)
+    assert len(x) == 1
+    key = list(x)[0]
+    assert x[key]['id'] == key
+    props = x[key]['properties']
+    assert props['name'] == 'Springfield Event'
+    assert props['flagship'] == 'Yes'
+    assert 'source' not in props
+
+
+def test_get_geodata_falls_back(monkeypatch):
+    geocoder = FakeGeocoder({'1 Main St, Springfield,IL': 0.5, 'Springfield,IL': 0.9})
+    monkeypatch.setattr(clients, 'geocoder', lambda: geocoder)
+    props = {'address': '1 Main St', 'city': 'Springfield', 'state': 'IL'}
+    sheet = {'abc': {'properties': props}}
+    pipeline.get_geodata(datasets.MARCHONPOLLS, sheet, ['abc'])
+    assert geocoder.calls == ['1 Main St, Springfield,IL', 'Springfield,IL']
+    assert sheet['abc']['geometry']['type'] == 'Point'
+    assert props['placeName'] == 'Springfield, Illinois'
+
+
+def test_get_geodata_drops_missing(monkeypatch):
+    geocoder = FakeGeocoder({'New Paltz, NY': 0.5})
+    monkeypatch.setattr(clients, 'geocoder', lambda: geocoder)
+    sheet = {
+        'New Paltz, NY': {'properties': {}},
+        'Nowhere': {'properties': {}},
+    }
+    # no match isn't worth retrying
+    assert pipeline.get_geodata(datasets.EVENTS, sheet, list(sheet)) == []
+    # low relevance is kept without geometry so merge drops it
+    assert list(sheet) == ['New Paltz, NY']
+    assert 'geometry' not in sheet['New Paltz, NY']
+
+
+def test_get_geodata_returns_errors(monkeypatch):
+    monkeypatch.setattr(pipeline.geocode.time, 'sleep', lambda seconds: None)
+    geocoder = FakeGeocoder({'New Paltz, NY': 0.9})
+    forward = geocoder.forward
+
+    def flaky(address, **kwargs):
+        if address == 'Down':
+            raise requests.exceptions.ConnectionError()
+        return forward(address, **kwargs)
+
+    geocoder.forward = flaky
+    monkeypatch.setattr(clients, 'geocoder', lambda: geocoder)
+    sheet = {key: {'properties': {}} for key in ('New Paltz, NY', 'Nowhere', 'Down')}
+    assert pipeline.get_geodata(datasets.EVENTS, sheet, list(sheet)) == ['Down']
+    assert list(sheet) == ['New Paltz, NY']
+
+
+def test_merge_data():
+    point = {'type': 'Point', 'coordinates': [-73.9, 40.8]}
+    dataset = {
+        'same': {'properties': {'name': 'same', 'placeName': 'NY'}, 'geometry': point},
+        'changed': {'properties': {'name': 'old'}, 'geometry': point},
+        'orphan': {'properties': {'name': 'orphan'}, 'geometry': point},
+    }
+    sheet = {
+        'same': {'properties': {'name': 'same'}},
+        'changed': {'properties': {'name': 'new'}},
+        'new': {'properties': {'name': 'new'}, 'geometry': point},
+        'ungeocoded': {'properties': {'name': 'ungeocoded'}},
+    }
+    merged, changes = pipeline.merge_data(sheet, dataset)
+    assert sorted(merged) == ['changed', 'new', 'same']
+    assert merged['changed']['properties']['name'] == 'new'
+    assert merged['same']['properties']['placeName'] == 'NY'
+    assert merged['new']['type'] == 'Feature'
+    assert changes.added == ['new']
+    assert changes.updated == ['changed']
+    assert changes.unchanged == ['same']
+    assert changes.removed == ['orphan']
+    assert changes.changed()
+    # the published dataset isn't modified
+    assert dataset['changed']['properties']['name'] == 'old'
+
+
+def test_merge_data_unchanged():
+    point = {'type': 'Point', 'coordinates': [-73.9, 40.8]}
+    dataset = {'same': {'properties': {'name': 'same'}, 'geometry': point}}
+    sheet = {'same': {'properties': {'name': 'same'}}}
+    merged, changes = pipeline.merge_data(sheet, dataset)
+    assert not changes.changed()
+    assert merged['same']['type'] == 'Feature'
+
+
+def test_features_digest():
+    features = [{'properties': {'b': 1, 'a': 'x'}}, {'geometry': None, 'properties': {}}]
+    expected = hashlib.md5(json.dumps(features, sort_keys=True,
+                                      separators=(',', ':')).encode('utf8')).hexdigest()
+    assert pipeline.features_digest(features) == expected
+    assert pipeline.features_digest([Feature(feature) for feature in features]) == expected
+    assert pipeline.features_digest([]) == hashlib.md5(b'[]').hexdigest()
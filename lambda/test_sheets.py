@@ -0,0 +1,66 @@
+import json
+
+import metrics
+import sheets
+from fakes import FakeDrive, FakeSheets
+
+
+def test_get_revision():
+    service = FakeDrive('42', '2019-01-01T00:00:00Z')
+    x = sheets.get_revision('abc', service)
+    assert x == {
+        'spreadsheetId': 'abc',
+        'version': '42',
+        'modifiedTime': '2019-01-01T00:00:00Z'
+    }
+
+
+def test_is_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setenv('STATE_DIR', str(tmp_path))
+    revision = sheets.get_revision('abc', FakeDrive('42'))
+    assert not sheets.is_unchanged('events.json', revision)
+    sheets.save_revision('events.json', revision)
+    assert sheets.is_unchanged('events.json', revision)
+    assert not sheets.is_unchanged('other.json', revision)
+    newer = sheets.get_revision('abc', FakeDrive('43'))
+    assert not sheets.is_unchanged('events.json', newer)
+    # no revision from Drive means always treat as changed
+    assert not sheets.is_unchanged('events.json', None)
+
+
+def test_iter_rows_pages():
+    rows = [['name', 'location']] + [['row %d' % i, str(i)] for i in range(1, 25)]
+    rows[10] = []
+    service = FakeSheets(rows, 1000)
+    x = list(sheets.iter_rows('abc', 'Sheet1!A1:S', page_size=10, service=service))
+    assert x == rows
+    assert service.calls[:3] == ['Sheet1!A1:S10', 'Sheet1!A11:S20', 'Sheet1!A21:S30']
+    # every page of the grid is read
+    assert len(service.calls) == 100
+
+
+def test_iter_rows_past_empty_pages():
+    rows = [['row %d' % i] for i in range(1, 6)] + [[]] * 17 + [['row 23'], [], ['row 25']]
+    service = FakeSheets(rows, 40)
+    x = list(sheets.iter_rows('abc', 'A1:S', page_size=5, service=service))
+    # the rows after the gap are in the same places
+    assert x == rows
+    assert len(service.calls) == 8
+
+
+def test_iter_rows_counts_bytes():
+    rows = [['row %d' % i] for i in range(1, 25)]
+    metrics.reset()
+    list(sheets.iter_rows('abc', 'A1:Z24', page_size=10, service=FakeSheets(rows, 1000)))
+    values = metrics.current().values
+    assert values['sheet.pages'] == 3
+    assert values['sheet.bytes'] == sum(
+        len(json.dumps({'values': rows[i:i + 10]}, separators=(',', ':'))) for i in (0, 10, 20))
+
+
+def test_iter_rows_bounded_range():
+    rows = [['row %d' % i] for i in range(1, 25)]
+    service = FakeSheets(rows, 1000)
+    x = list(sheets.iter_rows('abc', 'A2:Z15', page_size=10, service=service))
+    assert x == rows[1:15]
+    assert service.calls == ['A2:Z11', 'A12:Z15']
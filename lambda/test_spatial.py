@@ -0,0 +1,51 @@
+import random
+
+import spatial
+
+
+def make_points(n, seed=0):
+    rand = random.Random(seed)
+    return [(rand.uniform(-180, 180), rand.uniform(-90, 90), str(i)) for i in range(n)]
+
+
+def test_haversine():
+    # New York to Los Angeles
+    x = spatial.haversine(40.7128, -74.0060, 34.0522, -118.2437)
+    assert 3930 < x < 3950
+
+
+def test_nearest_matches_brute_force():
+    points = make_points(2000)
+    index = spatial.SpatialIndex.build(points)
+    rand = random.Random(1)
+    for _ in range(50):
+        lat, lon = rand.uniform(-90, 90), rand.uniform(-180, 180)
+        expected = spatial.brute_force_nearest(points, lat, lon, k=5)
+        actual = index.nearest(lat, lon, k=5)
+        assert [key for _, key in actual] == [key for _, key in expected]
+        for (d1, _), (d2, _) in zip(actual, expected):
+            assert abs(d1 - d2) < 1e-6
+
+
+def test_nearest_across_antimeridian():
+    index = spatial.SpatialIndex.build([(179.9, 0, 'east'), (-179.9, 0, 'west'),
+                                        (100, 0, 'far')])
+    assert [key for _, key in index.nearest(0, -179.99, k=2)] == ['west', 'east']
+
+
+def test_nearest_more_than_available():
+    index = spatial.SpatialIndex.build(make_points(3))
+    assert len(index.nearest(0, 0, k=10)) == 3
+    assert spatial.SpatialIndex.build([]).nearest(0, 0) == []
+
+
+def test_from_features_round_trip():
+    features = {
+        'New Paltz, NY': {'geometry': {'type': 'Point', 'coordinates': [-74.08, 41.75]}},
+        'no geometry': {'properties': {}},
+        'Kingston, NY': {'geometry': {'type': 'Point', 'coordinates': [-73.99, 41.93]}},
+    }
+    index = spatial.SpatialIndex.from_features(features)
+    assert len(index) == 2
+    loaded = spatial.SpatialIndex.from_json(index.to_json())
+    assert loaded.nearest(41.9, -74.0)[0][1] == 'Kingston, NY'
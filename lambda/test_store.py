@@ -0,0 +1,119 @@
+import pytest
+from botocore.exceptions import ClientError, ParamValidationError
+
+import clients
+import store
+
+
+class FakeObject:
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+
+    def load(self):
+        if self.bucket.forbidden:
+            raise ClientError({'Error': {'Code': '403'}}, 'HeadObject')
+        if self.key not in self.bucket.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        stored = self.bucket.objects[self.key]
+        self.e_tag = stored['ETag']
+        self.metadata = stored['Metadata']
+
+    def put(self, **kwargs):
+        if not self.bucket.conditional and ('IfMatch' in kwargs or 'IfNoneMatch' in kwargs):
+            raise ParamValidationError(report='Unknown parameter in input: "IfNoneMatch"')
+        self.bucket.puts.append(kwargs)
+        current = self.bucket.objects.get(self.key)
+        if self.bucket.race:
+            current = {'ETag': '"racer"'}
+        if ('IfMatch' in kwargs and (not current or current['ETag'] != kwargs['IfMatch'])) \
+                or ('IfNoneMatch' in kwargs and current):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.bucket.objects[self.key] = dict(kwargs, ETag='"%d"' % len(self.bucket.puts))
+        return {'ETag': self.bucket.objects[self.key]['ETag']}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+        self.race = False
+        # botocore before 1.35
+        self.conditional = True
+        # GetObject and HeadObject denied, as without s3:GetObject
+        self.forbidden = False
+
+    def Object(self, bucket, key):
+        assert bucket == store.BUCKET
+        return FakeObject(self, key)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(store, '_conditional_puts', True)
+    monkeypatch.setattr(clients, 's3', lambda: fake)
+    return fake
+
+
+def test_publish_new(s3):
+    assert store.publish('events.json', '{}')
+    assert s3.puts[0]['IfNoneMatch'] == '*'
+    assert s3.puts[0]['ACL'] == 'public-read'
+    assert s3.objects['events.json']['Body'] == b'{}'
+
+
+def test_publish_skips_unchanged(s3):
+    assert store.publish('events.json', '{}', digest='abc')
+    assert not store.publish('events.json', '{ }', digest='abc')
+    assert len(s3.puts) == 1
+
+
+def test_publish_changed(s3):
+    assert store.publish('events.json', '{}')
+    assert store.publish('events.json', '[]')
+    assert s3.puts[1]['IfMatch'] == '"1"'
+    assert s3.objects['events.json']['Body'] == b'[]'
+
+
+def test_publish_lost_race(s3):
+    assert store.publish('events.json', '{}')
+    s3.race = True
+    assert not store.publish('events.json', '[]')
+    assert len(s3.puts) == 2
+
+
+def test_publish_without_conditional_puts(s3):
+    s3.conditional = False
+    assert store.publish('events.json', '{}')
+    assert store.publish('events.json', '[]')
+    assert not store.publish('events.json', '[]')
+    assert 'IfMatch' not in s3.puts[1]
+    assert s3.objects['events.json']['Body'] == b'[]'
+    assert not store._conditional_puts
+
+
+def test_publish_forbidden(s3):
+    assert store.publish('events.json', '{}')
+    s3.forbidden = True
+    assert store.publish('events.json', '[]')
+    assert 'IfMatch' not in s3.puts[1] and 'IfNoneMatch' not in s3.puts[1]
+    assert s3.objects['events.json']['Body'] == b'[]'
+
+
+def test_load_json_forbidden(s3, monkeypatch):
+    monkeypatch.delenv('STATE_DIR', raising=False)
+
+    class Failing:
+        def __init__(self, code):
+            self.code = code
+
+        def get(self):
+            raise ClientError({'Error': {'Code': self.code}}, 'GetObject')
+
+    # what S3 says about a missing key without s3:ListBucket
+    monkeypatch.setattr(s3, 'Object', lambda bucket, key: Failing('AccessDenied'))
+    assert store.load_json('geocode_cache.json', {}) == {}
+    monkeypatch.setattr(s3, 'Object', lambda bucket, key: Failing('InternalError'))
+    with pytest.raises(ClientError):
+        store.load_json('geocode_cache.json', {})
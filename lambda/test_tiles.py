@@ -0,0 +1,208 @@
+import gzip
+import json
+import struct
+
+import tiles
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def read_message(data):
+    '''
+    [(field number, value)]; length-delimited values are bytes
+    '''
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value = struct.unpack('<d', data[pos:pos + 8])[0]
+            pos += 8
+        else:
+            length, pos = read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    number, value = read_message(data)[0]
+    if number == 1:
+        return value.decode('utf8')
+    if number == 7:
+        return bool(value)
+    if number == 6:
+        return unzigzag(value)
+    return value
+
+
+def decode_tile(data):
+    '''
+    {layer name: [(x, y, properties)]}
+    '''
+    result = {}
+    for _, layer in read_message(data):
+        fields = read_message(layer)
+        name = [value for number, value in fields if number == 1][0].decode('utf8')
+        keys = [value.decode('utf8') for number, value in fields if number == 3]
+        values = [decode_value(value) for number, value in fields if number == 4]
+        assert dict(fields)[15] == 2 and dict(fields)[5] == tiles.EXTENT
+        points = []
+        for number, feature in fields:
+            if number != 2:
+                continue
+            feature = dict(read_message(feature))
+            assert feature[3] == tiles.POINT
+            tags = read_packed(feature[2])
+            command, x, y = read_packed(feature[4])
+            assert command == 9
+            props = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+            points.append((unzigzag(x), unzigzag(y), props))
+        result[name] = points
+    return result
+
+
+def read_directory(data):
+    data = gzip.decompress(data)
+    count, pos = read_varint(data, 0)
+    columns = []
+    for _ in range(4):
+        column = []
+        for _ in range(count):
+            value, pos = read_varint(data, pos)
+            column.append(value)
+        columns.append(column)
+    entries = []
+    tile_id = 0
+    for i in range(count):
+        tile_id += columns[0][i]
+        offset = columns[3][i] - 1
+        if i and columns[3][i] == 0:
+            offset = entries[-1][1] + entries[-1][2]
+        entries.append((tile_id, offset, columns[2][i], columns[1][i]))
+    return entries
+
+
+def read_pmtiles(archive):
+    '''
+    (header fields, metadata, {tile id: MVT})
+    '''
+    assert archive[:7] == b'PMTiles'
+    header = struct.unpack('<BQQQQQQQQQQQBBBBBBiiiiBii', archive[7:127])
+    assert header[0] == 3
+    root_offset, root_length, meta_offset, meta_length, leaf_offset, _, data_offset = \
+        header[1:8]
+    metadata = json.loads(gzip.decompress(archive[meta_offset:meta_offset + meta_length]))
+    found = {}
+
+    def walk(entries):
+        for tile_id, offset, length, run_length in entries:
+            if run_length == 0:
+                start = leaf_offset + offset
+                walk(read_directory(archive[start:start + length]))
+                continue
+            body = gzip.decompress(archive[data_offset + offset:data_offset + offset + length])
+            for i in range(run_length):
+                found[tile_id + i] = body
+
+    walk(read_directory(archive[root_offset:root_offset + root_length]))
+    return header, metadata, found
+
+
+def point(lon, lat, **props):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': props}
+
+
+def test_zxy_to_tileid():
+    # from the PMTiles spec
+    assert [tiles.zxy_to_tileid(*zxy) for zxy in
+            [(0, 0, 0), (1, 0, 0), (1, 0, 1), (1, 1, 1), (1, 1, 0), (2, 0, 0)]] == \
+        [0, 1, 2, 3, 4, 5]
+    assert tiles.zxy_to_tileid(12, 3423, 1763) == 19078479
+
+
+def test_make_tiles_layers():
+    features = [
+        point(-73.97, 40.80, source='events', affiliate=True, name='Affiliate', photo=''),
+        point(-122.42, 37.77, source='actionnetwork', name='AN', attendees=-3,
+              photoUrls={'image/webp': 'a.webp 150w'}),
+        point(0, 0, affiliate=True),
+    ]
+    made = tiles.make_tiles(features, 0, 2)
+    assert set(made) == {(0, 0, 0), (1, 0, 0), (2, 1, 1), (2, 0, 1)}
+    decoded = decode_tile(made[(0, 0, 0)])
+    assert list(decoded) == ['marchon-affiliate-true', 'actionnetwork']
+    x, y, props = decoded['marchon-affiliate-true'][0]
+    assert props == {'source': 'events', 'affiliate': True, 'name': 'Affiliate'}
+    wx, wy = tiles.project(-73.97, 40.80)
+    assert (x, y) == (int(wx * tiles.EXTENT), int(wy * tiles.EXTENT))
+    assert x == int((180 - 73.97) / 360 * tiles.EXTENT)
+    _, _, props = decoded['actionnetwork'][0]
+    assert props['attendees'] == -3
+    assert json.loads(props['photoUrls']) == {'image/webp': 'a.webp 150w'}
+
+
+def test_make_tiles_thins_below_maxzoom():
+    features = [point(-73.97 + i * 1e-5, 40.80, source='actionnetwork') for i in range(50)]
+    made = tiles.make_tiles(features, 0, 3)
+    assert len(decode_tile(made[(0, 0, 0)])['actionnetwork']) == 1
+    assert len(decode_tile(made[(3, 2, 3)])['actionnetwork']) == 50
+
+
+def test_make_archive():
+    features = [point(-100 + i, 40, source='actionnetwork', name=str(i)) for i in range(20)]
+    archive = tiles.make_archive('events', {'features': features}, 0, 4)
+    header, metadata, found = read_pmtiles(archive)
+    assert metadata['vector_layers'] == [{
+        'id': 'actionnetwork', 'fields': {'source': 'String', 'name': 'String'},
+        'minzoom': 0, 'maxzoom': 4}]
+    assert metadata['format'] == 'pbf'
+    # internal and tile compression gzip, MVT, zooms
+    assert header[13:18] == (tiles.COMPRESSION_GZIP, tiles.COMPRESSION_GZIP,
+                             tiles.TILE_TYPE_MVT, 0, 4)
+    # a degree apart is less than a GRID cell at z0
+    z0 = decode_tile(found[tiles.zxy_to_tileid(0, 0, 0)])
+    assert [props['name'] for _, _, props in z0['actionnetwork']] == ['0', '10']
+    names = set()
+    for tile_id, tile in found.items():
+        if tile_id >= tiles.zxy_to_tileid(4, 0, 0):
+            names.update(props['name'] for _, _, props in decode_tile(tile)['actionnetwork'])
+    assert names == {str(i) for i in range(20)}
+
+
+def test_make_archive_leaf_directories(monkeypatch):
+    monkeypatch.setattr(tiles, 'ROOT_SIZE', 60)
+    features = [point(-179 + i * 7, -60 + i * 2.3, source='actionnetwork') for i in range(50)]
+    made = tiles.make_tiles(features, 0, 6)
+    header, _, found = read_pmtiles(tiles.make_pmtiles(made.items()))
+    # leaf directories were written
+    assert header[6] > 0
+    assert sorted(found) == sorted(tiles.zxy_to_tileid(*zxy) for zxy in made)
+    for zxy, tile in made.items():
+        assert found[tiles.zxy_to_tileid(*zxy)] == tile
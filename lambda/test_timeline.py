@@ -0,0 +1,47 @@
+import random
+
+from timeline import Timeline
+
+
+def make_features(n):
+    rng = random.Random(1)
+    return {
+        'key %d' % i: {'properties': {'eventEpoch': rng.randrange(1000)}}
+        for i in range(n)
+    }
+
+
+def test_between():
+    features = make_features(200)
+    features['undated'] = {'properties': {'eventEpoch': None}}
+    timeline = Timeline.from_features(features)
+    assert len(timeline) == 200
+    expected = sorted((f['properties']['eventEpoch'], key) for key, f in features.items()
+                      if key != 'undated' and 100 <= f['properties']['eventEpoch'] < 300)
+    assert timeline.between(100, 300) == expected
+    assert timeline.between(300, 100) == []
+
+
+def test_upcoming():
+    timeline = Timeline([(30, 'c'), (10, 'a'), (20, 'b'), (20, 'bb')])
+    assert timeline.upcoming(15, 2) == [(20, 'b'), (20, 'bb')]
+    assert timeline.upcoming(20, 10) == [(20, 'b'), (20, 'bb'), (30, 'c')]
+    assert timeline.upcoming(31, 1) == []
+
+
+def test_before():
+    timeline = Timeline([(30, 'c'), (10, 'a'), (20, 'b')])
+    assert timeline.before(20) == [(10, 'a')]
+    assert timeline.before(5) == []
+
+
+def test_from_features_normalizes():
+    # features published before eventEpoch was added
+    timeline = Timeline.from_features({
+        'later': {'properties': {'eventDate': '1/20/2019', 'startTime': '10am'}},
+        'sooner': {'properties': {'eventDate': '1/19/2019'}},
+        'undated': {'properties': {'eventDate': ''}},
+        'none': {'properties': {}},
+    })
+    assert timeline.entries == [(1547856000, 'sooner'), (1547978400, 'later')]
+    assert timeline.undated == ['undated', 'none']
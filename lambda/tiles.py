@@ -0,0 +1,346 @@
+'''
+a PMTiles (v3) archive of Mapbox Vector Tiles for a point dataset, so the map
+can fetch only the tiles in view instead of the whole FeatureCollection
+
+    events.json -> events.pmtiles
+
+each layer from layers.py is a vector tile layer with the features'
+properties as attributes. Below MAXZOOM, at most one point per GRID cell of
+a tile is kept per layer (the first in dataset order), so dense maps stay
+small at low zooms; every point is in the MAXZOOM tiles, which the map
+overzooms past that
+
+written by hand: points are the only geometry we have, and neither the MVT
+nor the PMTiles encoding needs more than varints
+    https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+    https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+'''
+import json
+import struct
+from math import atan, cos, degrees, exp, floor, log, pi, radians, tan
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import layers
+from compact import intern_names
+from outputs import gzip_compress
+
+MINZOOM = 0
+MAXZOOM = 10
+EXTENT = 4096
+# cells per tile side below MAXZOOM; 32 is one point per 8 px of a 256 px tile
+GRID = 32
+# spherical mercator stops here
+MAX_LATITUDE = 85.0511287798
+# the root directory has to fit in the first 16 KiB along with the header
+ROOT_SIZE = 16384 - 127
+
+MVT_VERSION = 2
+POINT = 1
+MOVE_TO = 1
+# PMTiles enums
+COMPRESSION_GZIP = 2
+TILE_TYPE_MVT = 1
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, data: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(data)) + data
+
+
+def _packed(number: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(number, b''.join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    '''
+    an MVT Value message
+    '''
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _field(5, 0) + _varint(value)
+        return _field(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, value.encode('utf8'))
+
+
+def attributes(props: Dict) -> List[Tuple[str, object]]:
+    '''
+    vector tile attributes for a feature's properties; empty values are
+    dropped (as in the minified GeoJSON) and lists and dicts become JSON
+    '''
+    attrs = []
+    for key, value in props.items():
+        if value is None or value == '':
+            continue
+        if not isinstance(value, (str, bool, int, float)):
+            value = json.dumps(value, separators=(',', ':'), sort_keys=True)
+        attrs.append((key, value))
+    return attrs
+
+
+def encode_layer(name: str, points: List[Tuple[int, int, Tuple, Tuple]]) -> bytes:
+    '''
+    an MVT Layer message of points [(x, y, attribute names, attribute values)]
+    in tile coordinates
+    '''
+    keys, values = {}, {}
+    features = []
+    for x, y, names, attrs in points:
+        tags = []
+        for key, value in zip(names, attrs):
+            tags.append(keys.setdefault(key, len(keys)))
+            # 1 and True are equal as dict keys but not as tile values
+            tags.append(values.setdefault((type(value), value), len(values)))
+        geometry = (MOVE_TO & 0x7) | (1 << 3), _zigzag(x), _zigzag(y)
+        features.append(
+            _bytes_field(2, _packed(2, tags) + _field(3, 0) + _varint(POINT) +
+                         _packed(4, geometry)))
+    return (_field(15, 0) + _varint(MVT_VERSION) +
+            _bytes_field(1, name.encode('utf8')) +
+            b''.join(features) +
+            b''.join(_bytes_field(3, key.encode('utf8')) for key in keys) +
+            b''.join(_bytes_field(4, _value(value)) for _, value in values) +
+            _field(5, 0) + _varint(EXTENT))
+
+
+def encode_tile(tile_layers: Dict[str, List[Tuple[int, int, Tuple, Tuple]]]) -> bytes:
+    return b''.join(
+        _bytes_field(3, encode_layer(name, points)) for name, points in tile_layers.items())
+
+
+def project(lon: float, lat: float) -> Tuple[float, float]:
+    '''
+    web mercator position in [0, 1) of the world, y increasing southward
+    '''
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180) / 360
+    y = (1 - log(tan(radians(lat)) + 1 / cos(radians(lat))) / pi) / 2
+    return min(max(x, 0), 1 - 1e-12), min(max(y, 0), 1 - 1e-12)
+
+
+def zxy_to_tileid(z: int, x: int, y: int) -> int:
+    '''
+    PMTiles tile id: the tiles of every lower zoom, then x, y along a Hilbert
+    curve, so tiles near each other on the map are near each other in the file
+    '''
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    n = 1 << z
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return tile_id
+
+
+def iter_tiles(features: List[Dict], minzoom: int = MINZOOM,
+               maxzoom: int = MAXZOOM) -> Iterator[Tuple[Tuple[int, int, int], bytes]]:
+    '''
+    ((z, x, y), uncompressed MVT) for the point features in each layer, a zoom
+    at a time, so only one zoom's tiles are held until they're encoded
+    '''
+    placed = []
+    for layer, layer_features in layers.split(features).items():
+        for feature in layer_features:
+            geometry = feature.get('geometry')
+            if not geometry:
+                continue
+            lon, lat = geometry['coordinates'][:2]
+            attrs = attributes(feature['properties'])
+            # names as one tuple shared by features with the same ones, like
+            # compact.Feature, rather than a (name, value) pair per attribute
+            placed.append((layer, project(lon, lat), intern_names(tuple(key for key, _ in attrs)),
+                           tuple(value for _, value in attrs)))
+
+    for z in range(minzoom, maxzoom + 1):
+        scale = 1 << z
+        taken = set()
+        tiles = {}
+        for layer, (wx, wy), names, attrs in placed:
+            tx, ty = floor(wx * scale), floor(wy * scale)
+            x = int((wx * scale - tx) * EXTENT)
+            y = int((wy * scale - ty) * EXTENT)
+            if z < maxzoom:
+                cell = (layer, tx, ty, x * GRID // EXTENT, y * GRID // EXTENT)
+                if cell in taken:
+                    continue
+                taken.add(cell)
+            tiles.setdefault((tx, ty), {}).setdefault(layer, []).append((x, y, names, attrs))
+        for (tx, ty), tile_layers in tiles.items():
+            yield (z, tx, ty), encode_tile(tile_layers)
+
+
+def make_tiles(features: List[Dict], minzoom: int = MINZOOM,
+               maxzoom: int = MAXZOOM) -> Dict[Tuple[int, int, int], bytes]:
+    '''
+    {(z, x, y): uncompressed MVT} for the point features in each layer
+    '''
+    return dict(iter_tiles(features, minzoom, maxzoom))
+
+
+def _directory(entries: List[Tuple[int, int, int, int]]) -> bytes:
+    '''
+    gzipped PMTiles directory of [(tile id, offset, length, run length)]
+    '''
+    out = [_varint(len(entries))]
+    last_id = 0
+    for tile_id, _, _, _ in entries:
+        out.append(_varint(tile_id - last_id))
+        last_id = tile_id
+    out.extend(_varint(run_length) for _, _, _, run_length in entries)
+    out.extend(_varint(length) for _, _, length, _ in entries)
+    for i, (_, offset, _, _) in enumerate(entries):
+        if i and offset == entries[i - 1][1] + entries[i - 1][2]:
+            out.append(_varint(0))
+        else:
+            out.append(_varint(offset + 1))
+    return gzip_compress(b''.join(out))
+
+
+def _directories(entries: List[Tuple[int, int, int, int]]) -> Tuple[bytes, bytes]:
+    '''
+    (root directory, leaf directories); entries only go in leaves if the
+    root can't hold them all
+    '''
+    root = _directory(entries)
+    if len(root) <= ROOT_SIZE:
+        return root, b''
+    leaf_size = 4096
+    while True:
+        leaves, root_entries = [], []
+        offset = 0
+        for i in range(0, len(entries), leaf_size):
+            chunk = entries[i:i + leaf_size]
+            leaf = _directory(chunk)
+            # run length 0 points at a leaf directory
+            root_entries.append((chunk[0][0], offset, len(leaf), 0))
+            leaves.append(leaf)
+            offset += len(leaf)
+        root = _directory(root_entries)
+        if len(root) <= ROOT_SIZE:
+            return root, b''.join(leaves)
+        leaf_size *= 2
+
+
+def make_pmtiles(tiles: Iterable[Tuple[Tuple[int, int, int], bytes]],
+                 metadata: Dict = None) -> bytes:
+    '''
+    a PMTiles v3 archive of [((z, x, y), MVT)]; tiles are gzipped as they
+    come, and identical tiles are stored once
+    '''
+    zxys = []
+    compressed = []
+    for zxy, tile in tiles:
+        zxys.append(zxy)
+        compressed.append((zxy_to_tileid(*zxy), gzip_compress(tile)))
+    data = []
+    entries = []
+    offsets = {}
+    size = 0
+    for tile_id, body in sorted(compressed, key=lambda entry: entry[0]):
+        if body not in offsets:
+            offsets[body] = size
+            data.append(body)
+            size += len(body)
+        offset = offsets[body]
+        last = entries[-1] if entries else None
+        if last and last[1] == offset and last[0] + last[3] == tile_id:
+            entries[-1] = (last[0], last[1], last[2], last[3] + 1)
+        else:
+            entries.append((tile_id, offset, len(body), 1))
+
+    zooms = [z for z, _, _ in zxys] or [0]
+    bounds = _bounds(zxys) if zxys else (-180, -85, 180, 85)
+    metadata = dict(metadata or {}, format='pbf')
+    meta = gzip_compress(json.dumps(metadata, separators=(',', ':')).encode('utf8'))
+    root, leaves = _directories(entries)
+
+    root_offset = 127
+    meta_offset = root_offset + len(root)
+    leaf_offset = meta_offset + len(meta)
+    data_offset = leaf_offset + len(leaves)
+    header = b'PMTiles' + struct.pack(
+        '<BQQQQQQQQQQQBBBBBBiiiiBii', 3,
+        root_offset, len(root), meta_offset, len(meta), leaf_offset, len(leaves),
+        data_offset, size,
+        sum(entry[3] for entry in entries), len(entries), len(data),
+        1, COMPRESSION_GZIP, COMPRESSION_GZIP, TILE_TYPE_MVT,
+        min(zooms), max(zooms),
+        *[int(round(value * 10000000)) for value in bounds],
+        min(zooms),
+        int(round((bounds[0] + bounds[2]) / 2 * 10000000)),
+        int(round((bounds[1] + bounds[3]) / 2 * 10000000)))
+    assert len(header) == 127
+    return header + root + meta + leaves + b''.join(data)
+
+
+def _bounds(tiles) -> Tuple[float, float, float, float]:
+    '''
+    lon/lat bounds of the tiles at the highest zoom
+    '''
+    z = max(z for z, _, _ in tiles)
+    xs = [x for tz, x, _ in tiles if tz == z]
+    ys = [y for tz, _, y in tiles if tz == z]
+
+    def lon(x):
+        return x / (1 << z) * 360 - 180
+
+    def lat(y):
+        return degrees(atan(exp(pi * (1 - 2 * y / (1 << z)))) * 2 - pi / 2)
+
+    return lon(min(xs)), lat(max(ys) + 1), lon(max(xs) + 1), lat(min(ys))
+
+
+def vector_layers(features: List[Dict], minzoom: int = MINZOOM,
+                  maxzoom: int = MAXZOOM) -> List[Dict]:
+    '''
+    TileJSON vector_layers: each layer's attribute names and types
+    '''
+    types = {bool: 'Boolean', int: 'Number', float: 'Number', str: 'String'}
+    result = []
+    for layer, layer_features in layers.split(features).items():
+        fields = {}
+        for feature in layer_features:
+            for key, value in attributes(feature.get('properties') or {}):
+                fields.setdefault(key, types[type(value)])
+        result.append({'id': layer, 'fields': fields, 'minzoom': minzoom, 'maxzoom': maxzoom})
+    return result
+
+
+def make_archive(name: str, data: Dict, minzoom: int = MINZOOM,
+                 maxzoom: int = MAXZOOM) -> bytes:
+    '''
+    PMTiles archive of a FeatureCollection
+    '''
+    features = data['features']
+    return make_pmtiles(
+        iter_tiles(features, minzoom, maxzoom), {
+            'name': name,
+            'type': 'overlay',
+            'vector_layers': vector_layers(features, minzoom, maxzoom),
+        })
@@ -0,0 +1,69 @@
+'''
+events in start order, for range and next-N lookups without scanning every
+feature
+
+entries are (eventEpoch, key) sorted by time, so both lookups are a binary
+search plus the slice they return; see dates.normalize for eventEpoch.
+layers.partition and outputs.make_archive split past from upcoming events
+with it
+'''
+from bisect import bisect_left
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import dates
+
+
+def feature_epoch(feature: Dict) -> Optional[int]:
+    props = feature.get('properties') or {}
+    if 'eventEpoch' not in props:
+        # published before dates were normalized at ingest
+        props = dict(props)
+        dates.normalize(props)
+    return props.get('eventEpoch')
+
+
+class Timeline:
+    def __init__(self, entries: Iterable[Tuple[int, Hashable]], undated: List = None):
+        self.entries = sorted(entries)
+        self.epochs = [epoch for epoch, _ in self.entries]
+        # keys of events without a date, in the order given
+        self.undated = undated or []
+
+    @classmethod
+    def from_features(cls, features: Dict[Hashable, Dict]) -> 'Timeline':
+        '''
+        index {key: feature}; features without an eventEpoch go in undated
+        '''
+        entries, undated = [], []
+        for key, feature in features.items():
+            epoch = feature_epoch(feature)
+            if epoch is None:
+                undated.append(key)
+            else:
+                entries.append((epoch, key))
+        return cls(entries, undated)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def between(self, start: int, end: int) -> List[Tuple[int, Hashable]]:
+        '''
+        [(epoch, key)] of events starting at or after start and before end
+        '''
+        lo = bisect_left(self.epochs, start)
+        hi = bisect_left(self.epochs, end, lo)
+        return self.entries[lo:hi]
+
+    def before(self, end: int) -> List[Tuple[int, Hashable]]:
+        '''
+        [(epoch, key)] of events starting before end
+        '''
+        return self.entries[:bisect_left(self.epochs, end)]
+
+    def upcoming(self, now: int, n: int = None) -> List[Tuple[int, Hashable]]:
+        '''
+        [(epoch, key)] of the first n events (all if n is None) starting at
+        or after now
+        '''
+        lo = bisect_left(self.epochs, now)
+        return self.entries[lo:] if n is None else self.entries[lo:lo + n]